@@ -2,13 +2,24 @@ import os
 import sys
 from flask import Flask, render_template, request, jsonify, send_from_directory
 import pandas as pd
+import numpy as np
+import h3
 import json
+import uuid
 from src.fetch_csv_data import *
 from src import *
 from src.fetch_data import *
 # from src.data_io import *
 from src.data_prep import *
+from src.poi_index import *
 from src.scoring import *
+from src.accessibility_store import *
+from src.fft_scoring import *
+from src.distance_matrix import *
+from src.road_network import *
+from src.transit import *
+from src.h3_geometry import *
+from src.score_cache import AccessibilityCache
 from src.threshold_clustering import *
 from src.dbscan_clustering import *
 from src.visualization import *
@@ -28,9 +39,86 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(BASE_DIR, 'data', 'input_data')
 RESULT_MAPS_DIR = os.path.join(BASE_DIR, 'static', 'result_maps')
 
+ACCESSIBILITY_STORE_DIR = os.path.join(BASE_DIR, 'data', 'output_data', 'accessibility_store')
+DISTANCE_MATRIX_DIR = os.path.join(BASE_DIR, 'data', 'output_data', 'distance_matrix')
+ROAD_NETWORK_DIR = os.path.join(BASE_DIR, 'data', 'input_data', 'road_network')
+GTFS_DIR = os.path.join(BASE_DIR, 'data', 'input_data', 'marta_gtfs')
+
+# Opt-in parallel accessibility scoring (1 = serial)
+SCORING_WORKERS = int(os.environ.get("SCORING_WORKERS", 1))
+SCORING_CHUNK_SIZE = int(os.environ.get("SCORING_CHUNK_SIZE", 500))
+
+# Optional H3 resolution (10/11) to pre-aggregate POIs into weighted bins before scoring
+POI_BIN_RESOLUTION = int(os.environ["POI_BIN_RESOLUTION"]) if os.environ.get("POI_BIN_RESOLUTION") else None
+
+# Citywide score normalization for user weights: "minmax" or "percentile" (1st-99th)
+NORMALIZATION_METHOD = os.environ.get("NORMALIZATION_METHOD", "minmax")
+
+# Rent of hexagons without listings: "median" of the nearest known hexes or "idw"
+RENT_IMPUTATION_METHOD = os.environ.get("RENT_IMPUTATION_METHOD", "median")
+
+# Upper bounds of the request's spatial smoothing options
+MAX_SMOOTHING_K = 3
+MAX_SMOOTHING_ITERATIONS = 5
+
+# Accessibility cache budget for long-running servers
+ACCESSIBILITY_CACHE_MAX_MB = int(os.environ.get("ACCESSIBILITY_CACHE_MAX_MB", 256))
+ACCESSIBILITY_CACHE_TTL_SECONDS = int(os.environ.get("ACCESSIBILITY_CACHE_TTL_SECONDS", 6 * 60 * 60))
+
+# Scored results kept for /data/pois/top "show more" cursors and /data/pois/explain
+SCORED_RESULTS_TTL_SECONDS = int(os.environ.get("SCORED_RESULTS_TTL_SECONDS", 30 * 60))
+SCORED_RESULTS = AccessibilityCache(max_bytes=64 * 1024 ** 2, ttl_seconds=SCORED_RESULTS_TTL_SECONDS)
+
+# Columns of a slim /data/pois response: explanations are fetched per hexagon via /data/pois/explain
+SLIM_RESPONSE_COLUMNS = ['hex_id', 'user_match_score', 'suitability', 'suitability_label']
+
 # Ensure the result map directory exists
 os.makedirs(RESULT_MAPS_DIR, exist_ok=True)
 
+# Precomputed citywide accessibility scores (built offline with `python -m src.accessibility_store`)
+ACCESSIBILITY_STORE = load_accessibility_store(ACCESSIBILITY_STORE_DIR)
+# res 7 aggregated from the stored res 8 cells; res 9 is computed on demand
+ACCESSIBILITY_PYRAMID = build_accessibility_pyramid(ACCESSIBILITY_STORE)
+# fixed per-column bounds over the whole coverage area, so match scores are comparable across requests
+ACCESSIBILITY_NORMALIZATION = {
+    has_car: citywide_normalization(ACCESSIBILITY_STORE, has_car, NORMALIZATION_METHOD) for has_car in (True, False)
+}
+# H3 geometry rows kept in memory; sized to hold the coverage area plus request margins
+get_geometry_cache().max_cells = int(os.environ.get("GEOMETRY_CACHE_MAX_CELLS", MAX_GEOMETRY_CACHE_CELLS))
+if ACCESSIBILITY_STORE is not None:
+    # centroids / boundaries / neighbors of the whole coverage area in one batch
+    warm_geometry_cache([h3.int_to_str(int(hex_id)) for hex_id in ACCESSIBILITY_STORE['hex_ids']])
+
+# Sparse hex x POI distances for custom decay configs (built offline with `python -m src.distance_matrix`)
+DISTANCE_MATRIX = load_distance_matrix(DISTANCE_MATRIX_DIR)
+
+# Road graph for network distance scoring (prepared nodes.csv / edges.csv extract)
+ROAD_NETWORK = load_road_network(ROAD_NETWORK_DIR)
+if ROAD_NETWORK is not None:
+    # one multi-source Dijkstra per POI type up front, requests only read the distance fields
+    precompute_network_distance_fields(ROAD_NETWORK, load_pois(), [get_poi_types_config(True), get_poi_types_config(False)])
+
+# rent per hex for every pyramid resolution, rebuilt only when the rent data changes
+precompute_rent_surfaces(load_rent(), PYRAMID_RESOLUTIONS)
+# known or nearest-known rent of every materialized cell, so requests only look it up
+precompute_imputed_rent(load_rent(), {
+    resolution: [h3.int_to_str(int(hex_id)) for hex_id in level['hex_ids']]
+    for resolution, level in ACCESSIBILITY_PYRAMID.items()
+}, K=1, method=RENT_IMPUTATION_METHOD)
+
+# MARTA GTFS timetable for the transit_accessibility column (has_car=False)
+# one representative weekday of the feed's calendar, or explicit GTFS_SERVICE_IDS="id1,id2"
+GTFS_SERVICE_IDS = os.environ["GTFS_SERVICE_IDS"].split(",") if os.environ.get("GTFS_SERVICE_IDS") else None
+TRANSIT_TIMETABLE = load_transit_timetable(
+    GTFS_DIR,
+    service_ids=GTFS_SERVICE_IDS or (representative_service_ids(GTFS_DIR) if os.path.isdir(GTFS_DIR) else None),
+)
+# hexagons a request may route with RAPTOR when the store has no transit scores for them
+TRANSIT_ON_DEMAND_MAX_HEXAGONS = int(os.environ.get("TRANSIT_ON_DEMAND_MAX_HEXAGONS", MAX_ON_DEMAND_TRANSIT_HEXAGONS))
+
+get_accessibility_cache().max_bytes = ACCESSIBILITY_CACHE_MAX_MB * 1024 ** 2
+get_accessibility_cache().ttl_seconds = ACCESSIBILITY_CACHE_TTL_SECONDS
+
 app = Flask(__name__)
 
 # ====================================================================
@@ -60,6 +148,139 @@ def index():
     """Renders the main input form."""
     return render_template('index.html', poi_types=POI_TYPES)
 
+def prepare_area_hexagons(data):
+    """
+    Shared upstream stages of the scoring endpoints: hex grid for the
+    center/radius, accessibility scores, rent merge, smoothing and budget filter.
+    Returns dict with the scored df_hexagons plus the request options used.
+    """
+    # Call the data loader function
+    df_pois = load_pois()
+    df_rent = load_rent()
+    # per-type spatial index, only rebuilt when the POI data changes
+    poi_index = get_poi_index(df_pois)
+
+    #get inputs from UI payload
+    user_radius_miles = data.get("radius_km", 12)
+    budget = data.get("budget", 1000)
+    has_car = data.get("has_car", True)
+    user_center = tuple(data.get("center", (33.749, -84.388)))
+    # "exact" (default) or "approximate" (FFT-based, for metro-scale radii)
+    scoring_mode = data.get("scoring_mode", "exact")
+    approx_cell_km = float(data.get("approx_cell_km", DEFAULT_FFT_CELL_KM))
+    if approx_cell_km < MIN_FFT_CELL_KM:
+        raise ValueError(f"approx_cell_km must be at least {MIN_FFT_CELL_KM}, got {approx_cell_km}")
+    if scoring_mode not in ("exact", "approximate"):
+        raise ValueError(f"scoring_mode must be 'exact' or 'approximate', got {scoring_mode}")
+    # "euclidean" (default) straight-line distance or "network" road travel distance
+    distance_mode = data.get("distance_mode", "euclidean")
+    if distance_mode not in ("euclidean", "network"):
+        raise ValueError(f"distance_mode must be 'euclidean' or 'network', got {distance_mode}")
+    if distance_mode == "network" and scoring_mode == "approximate":
+        raise ValueError("Approximate scoring is only available for euclidean distance")
+    # optional per-type kernel overrides, e.g. {"restaurant": {"decay_rate": 2.0}}
+    config_overrides = data.get("poi_types_config")
+    poi_types_config = None
+    if config_overrides:
+        poi_types_config = merge_poi_types_config(get_poi_types_config(has_car), config_overrides)
+    # H3 resolution of the returned cells, either explicit or derived from the map zoom
+    if data.get("resolution") is not None:
+        resolution = int(data["resolution"])
+    elif data.get("zoom") is not None:
+        resolution = resolution_for_zoom(float(data["zoom"]))
+    else:
+        resolution = PYRAMID_BASE_RESOLUTION
+    if resolution not in PYRAMID_RESOLUTIONS:
+        raise ValueError(f"resolution must be one of {PYRAMID_RESOLUTIONS}, got {resolution}")
+
+    # spatial smoothing: k-ring radius, 'uniform' or 'inverse_distance' kernel, number of passes
+    smoothing_k = int(data.get("smoothing_k", 1))
+    smoothing_kernel = data.get("smoothing_kernel", "uniform")
+    smoothing_iterations = int(data.get("smoothing_iterations", 1))
+    # both grow the neighbor matrix (and its matrix power) quickly, so they are bounded
+    if not 0 <= smoothing_k <= MAX_SMOOTHING_K:
+        raise ValueError(f"smoothing_k must be between 0 and {MAX_SMOOTHING_K}, got {smoothing_k}")
+    if not 0 <= smoothing_iterations <= MAX_SMOOTHING_ITERATIONS:
+        raise ValueError(f"smoothing_iterations must be between 0 and {MAX_SMOOTHING_ITERATIONS}, got {smoothing_iterations}")
+
+    # "citywide" (fixed bounds from the store, default when available) or "request" (min-max over this area)
+    normalization_scope = data.get("normalization", "citywide")
+    if normalization_scope not in ("citywide", "request"):
+        raise ValueError(f"normalization must be 'citywide' or 'request', got {normalization_scope}")
+    # citywide bounds describe the default straight-line scores only
+    normalization = None
+    if normalization_scope == "citywide" and poi_types_config is None and distance_mode == "euclidean":
+        normalization = ACCESSIBILITY_NORMALIZATION[bool(has_car)]
+
+    print(f"User Radius (miles): {user_radius_miles}")
+
+    #call data_prep method here, providing df_pois as input
+    hexagons = create_hex_grids_with_radius(df_pois, radius_km=user_radius_miles*1.60934, center=user_center , size_of_grid=PYRAMID_BASE_RESOLUTION)
+    hexagons = pyramid_hexagons(hexagons, resolution)
+    print(f"Number of hexagons created: {len(hexagons)} at resolution {resolution}")
+
+    # rent first, so unaffordable cells (beyond the smoothing neighborhood) are never scored
+    df_rent_hex = get_imputed_rent(df_rent, hexagons, resolution=resolution, K=1, method=RENT_IMPUTATION_METHOD)
+    hexagons = plan_budget_pushdown(df_rent_hex, budget, neighbor_rings=smoothing_k * smoothing_iterations)
+
+    #call scoring method here, providing scored data as input
+    df_hexagons = get_pyramid_scores(
+        hexagons, df_pois, has_car,
+        resolution=resolution,
+        pyramid=ACCESSIBILITY_PYRAMID,
+        poi_types_config=poi_types_config,
+        distance_matrix=DISTANCE_MATRIX,
+        poi_index=poi_index,
+        n_workers=SCORING_WORKERS,
+        chunk_size=SCORING_CHUNK_SIZE,
+        method='network' if distance_mode == "network" else 'fft' if scoring_mode == "approximate" else 'indexed',
+        road_network=ROAD_NETWORK,
+        fft_cell_km=approx_cell_km,
+        poi_bin_resolution=POI_BIN_RESOLUTION,
+    )
+    approximation_error = None
+    if scoring_mode == "approximate":
+        approximation_error = fft_error_report(
+            df_hexagons, poi_index, poi_types_config or get_poi_types_config(has_car), cell_km=approx_cell_km
+        )
+
+    # transit reachability, precomputed in the store; a capped number of cells outside it are routed on demand
+    warnings = []
+    if not has_car and TRANSIT_TIMETABLE is not None:
+        df_hexagons = add_transit_accessibility(
+            df_hexagons, TRANSIT_TIMETABLE, df_pois,
+            store=ACCESSIBILITY_STORE, max_on_demand=TRANSIT_ON_DEMAND_MAX_HEXAGONS,
+        )
+        if 'transit_accessibility' not in df_hexagons.columns:
+            warnings.append(
+                f"Transit accessibility omitted: the area has more than {TRANSIT_ON_DEMAND_MAX_HEXAGONS} "
+                f"hexagons without precomputed transit scores."
+            )
+
+    #perform fucntions on rent
+    df_hexagons = merge_budget_with_accessibility(df_hexagons, df_rent_hex)
+
+    #smooth the scores
+    df_hexagons = smooth_scores_spatially(
+        df_hexagons, neighbor_weight=0.3,
+        k=smoothing_k, kernel=smoothing_kernel, iterations=smoothing_iterations,
+    )
+
+    #filter hexagons based on budget
+    df_hexagons = filter_hexagons_by_budget(df_hexagons, max_budget=budget)
+
+    return {
+        'df_pois': df_pois,
+        'df_hexagons': df_hexagons,
+        'resolution': resolution,
+        'scoring_mode': scoring_mode,
+        'distance_mode': distance_mode,
+        'approximation_error': approximation_error,
+        'normalization': normalization,
+        'warnings': warnings,
+    }
+
+
 @app.route('/data/pois', methods=['POST'])
 def get_poi_data():
     """
@@ -73,9 +294,6 @@ def get_poi_data():
     # table_name = request.args.get('table', default_table)
     
     try:
-        # Call the data loader function
-        df_pois = load_pois()
-        df_rent = load_rent()
         # we'll need data form UI payload
         # format required
         """
@@ -92,13 +310,15 @@ def get_poi_data():
             'park': 4
         },
         "budget": 1000,
-        "has_car": True
+        "has_car": True,
+        "slim": False
         }
+        With "slim": true only hex_id, score and tier are returned, plus a
+        result_id for fetching explanations from /data/pois/explain.
         """
 
         #get inputs from UI payload
         data = request.get_json(force=True) or {}
-        user_radius_miles = data.get("radius_km", 12)
         user_weights = data.get("user_weights", {
             'police_station': 6,
             'grocery_store': 1,
@@ -108,35 +328,14 @@ def get_poi_data():
             'restaurant': 3,
             'park': 4
         })
-        budget = data.get("budget", 1000)
-        has_car = data.get("has_car", True)
-        user_center = tuple(data.get("center", (33.749, -84.388)))
-
-        print(f"User Radius (miles): {user_radius_miles}")
         print(f"User Weights: {user_weights}")
 
-
-
-        #call data_prep method here, providing df_pois as input
-        hexagons = create_hex_grids_with_radius(df_pois, radius_km=user_radius_miles*1.60934, center=user_center , size_of_grid=8)
-        print(f"Number of hexagons created: {len(hexagons)}")
-
-        #call scoring method here, providing scored data as input
-        df_hexagons = calculate_accessibility_scores(hexagons, df_pois, has_car)
-
-        #perform fucntions on rent
-        df_budget_hex = convert_rent_data_to_h3(df_rent)
-        df_out = get_nearest_rent(df_budget_hex, hexagons, K=1)
-        df_hexagons = merge_budget_with_accessibility(df_hexagons, df_out)
-
-        #smooth the scores
-        df_hexagons = smooth_scores_spatially(df_hexagons, neighbor_weight=0.3)
-
-        #filter hexagons based on budget
-        df_hexagons = filter_hexagons_by_budget(df_hexagons, max_budget=budget)
+        area = prepare_area_hexagons(data)
+        df_pois = area['df_pois']
+        df_hexagons = area['df_hexagons']
 
         #apply user weights
-        df_hexagons = apply_user_weights(df_hexagons, user_weights)
+        df_hexagons = apply_user_weights(df_hexagons, user_weights, normalization=area['normalization'])
 
 
         # df_hexagons = apply_user_weights(
@@ -149,9 +348,17 @@ def get_poi_data():
         #call clustering method here, providing scored data as input
         df_classified = cluster_based_on_score(df_hexagons, n_tiers=10)
         print("type of df_classified:", type(df_classified))
+
+        result_id = None
+        df_response = df_classified
+        if data.get("slim", False):
+            result_id = uuid.uuid4().hex
+            SCORED_RESULTS.put(result_id, df_classified)
+            df_response = df_classified[SLIM_RESPONSE_COLUMNS]
+
         #call visualization method here (if needed to return map data)
         # UI team needs a JSON output, the following fucntion converts the data to JSON
-        df_classified_json = df_classified.to_json(orient='records')
+        df_classified_json = df_response.to_json(orient='records')
         df_classified_json = json.loads(df_classified_json)
         print("type of df_classified_json:", type(df_classified_json))
 
@@ -167,6 +374,12 @@ def get_poi_data():
             'success': True,
             'message': f'Successfully loaded {len(df_pois)} Points of Interest.',
             'record_count': len(df_pois),
+            'scoring_mode': area['scoring_mode'],
+            'resolution': area['resolution'],
+            'distance_mode': area['distance_mode'],
+            'approximation_error': area['approximation_error'],
+            'warnings': area['warnings'],
+            'result_id': result_id,
             'data':df_classified_json
         }), 200
 
@@ -185,6 +398,185 @@ def get_poi_data():
             'message': f'An unexpected error occurred during fetch: {str(e)}'
         }), 500
 
+@app.route('/data/pois/batch', methods=['POST'])
+def get_poi_data_batch():
+    """
+    Scores N weight profiles against one area (same payload as /data/pois, with
+    "profiles": {name: user_weights} or a list of user_weights instead of
+    "user_weights"). Every upstream stage runs once and all match scores come
+    from one matrix product. Optional "top_n" limits each ranking.
+    """
+    try:
+        data = request.get_json(force=True) or {}
+        profiles = data.get("profiles")
+        if not profiles or not isinstance(profiles, (dict, list)):
+            raise ValueError("profiles must be a non-empty dict or list of user_weights")
+        if isinstance(profiles, list):
+            profiles = {str(i): weights for i, weights in enumerate(profiles)}
+        for name, weights in profiles.items():
+            if not isinstance(weights, dict):
+                raise ValueError(f"profile {name} must map POI types to weights, got {weights!r}")
+            for poi_type, weight in weights.items():
+                if isinstance(weight, bool) or not isinstance(weight, (int, float)) or not np.isfinite(weight):
+                    raise ValueError(f"weight of {poi_type} in profile {name} must be a number, got {weight!r}")
+        top_n = data.get("top_n")
+        if top_n is not None:
+            top_n = int(top_n)
+            if top_n < 1:
+                raise ValueError(f"top_n must be positive, got {top_n}")
+
+        area = prepare_area_hexagons(data)
+        df_hexagons = area['df_hexagons']
+        profile_scores = score_user_profiles(df_hexagons, profiles, normalization=area['normalization'])
+
+        return jsonify({
+            'success': True,
+            'message': f'Scored {len(profiles)} profiles over {len(df_hexagons)} hexagons.',
+            'resolution': area['resolution'],
+            'scoring_mode': area['scoring_mode'],
+            'distance_mode': area['distance_mode'],
+            'warnings': area['warnings'],
+            'rankings': rank_user_profiles(df_hexagons, profile_scores, top_n=top_n),
+        }), 200
+
+    except ValueError as ve:
+        return jsonify({
+            'success': False,
+            'message': f'Data Validation Error: {str(ve)}'
+        }), 400
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({
+            'success': False,
+            'message': f'An unexpected error occurred during batch scoring: {str(e)}'
+        }), 500
+
+def _top_k_page(df_classified, result_id, k, offset):
+    # rows offset .. offset + k of the ranking, with the fields that explain each score
+    explanation_columns = ['hex_id', 'lat', 'lon', 'user_match_score', 'suitability', 'suitability_label', 'avg_rent'] + [
+        col for col in df_classified.columns if col.endswith('_accessibility') or col.endswith('_norm')
+    ]
+    explanation_columns = [col for col in explanation_columns if col in df_classified.columns]
+    positions = top_k_positions(df_classified['user_match_score'].to_numpy(), k, offset)
+    df_page = df_classified.iloc[positions][explanation_columns]
+    df_page.insert(0, 'rank', np.arange(offset + 1, offset + len(positions) + 1))
+
+    next_offset = offset + len(positions)
+    return {
+        'success': True,
+        'total': len(df_classified),
+        'offset': offset,
+        'results': json.loads(df_page.to_json(orient='records')),
+        'next_cursor': f"{result_id}:{next_offset}" if next_offset < len(df_classified) else None,
+    }
+
+
+@app.route('/data/pois/top', methods=['POST'])
+def get_top_hexagons():
+    """
+    Only the K best hexagons by user_match_score, with their explanation fields.
+    First call: same payload as /data/pois plus "k" (default 10).
+    Show more: {"cursor": <next_cursor>, "k": ...}; the ranked result is kept
+    server-side, so pages never recompute the scores.
+    """
+    try:
+        data = request.get_json(force=True) or {}
+        k = int(data.get("k", 10))
+        if k < 1:
+            raise ValueError(f"k must be positive, got {k}")
+
+        cursor = data.get("cursor")
+        if cursor:
+            result_id, _, offset = cursor.partition(":")
+            df_classified = SCORED_RESULTS.get(result_id)
+            if df_classified is None:
+                return jsonify({
+                    'success': False,
+                    'message': 'Cursor expired, please run the query again'
+                }), 410
+            return jsonify(_top_k_page(df_classified, result_id, k, int(offset))), 200
+
+        user_weights = data.get("user_weights", {
+            'police_station': 6,
+            'grocery_store': 1,
+            'hospital': 5,
+            'marta_stop': 2,
+            'school': 0,
+            'restaurant': 3,
+            'park': 4
+        })
+        area = prepare_area_hexagons(data)
+        df_hexagons = apply_user_weights(area['df_hexagons'], user_weights, normalization=area['normalization'])
+        df_classified = cluster_based_on_score(df_hexagons, n_tiers=10)
+
+        result_id = uuid.uuid4().hex
+        SCORED_RESULTS.put(result_id, df_classified)
+        page = _top_k_page(df_classified, result_id, k, 0)
+        page['warnings'] = area['warnings']
+        return jsonify(page), 200
+
+    except ValueError as ve:
+        return jsonify({
+            'success': False,
+            'message': f'Data Validation Error: {str(ve)}'
+        }), 400
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({
+            'success': False,
+            'message': f'An unexpected error occurred during top-k query: {str(e)}'
+        }), 500
+
+@app.route('/data/pois/explain', methods=['POST'])
+def explain_hexagons():
+    """
+    Per-feature contributions (weight x norm) to user_match_score for the
+    requested hexagons of a cached result.
+    Payload: {"result_id": <from a slim /data/pois or /data/pois/top>, "hex_ids": [...]}
+    """
+    try:
+        data = request.get_json(force=True) or {}
+        hex_ids = data.get("hex_ids")
+        if not hex_ids:
+            raise ValueError("hex_ids must be a non-empty list")
+
+        df_classified = SCORED_RESULTS.get(data.get("result_id", ""))
+        if df_classified is None:
+            return jsonify({
+                'success': False,
+                'message': 'Result expired, please run the query again'
+            }), 410
+
+        explanations, missing = explain_user_scores(df_classified, hex_ids)
+        return jsonify({
+            'success': True,
+            'explanations': explanations,
+            'missing': missing,
+        }), 200
+
+    except ValueError as ve:
+        return jsonify({
+            'success': False,
+            'message': f'Data Validation Error: {str(ve)}'
+        }), 400
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({
+            'success': False,
+            'message': f'An unexpected error occurred during explain: {str(e)}'
+        }), 500
+
+@app.route('/data/cache_stats', methods=['GET'])
+def get_cache_stats():
+    """Hit/miss/eviction counters of the accessibility cache."""
+    return jsonify({
+        'success': True,
+        'accessibility_cache': get_accessibility_cache().stats()
+    }), 200
+
 @app.route('/analyze', methods=['POST'])
 def analyze():
     """
@@ -0,0 +1,383 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+import h3
+import h3.api.numpy_int as h3_int
+from src.poi_index import fingerprint_pois, get_poi_index
+from src.scoring import calculate_accessibility_scores, get_poi_types_config, poi_delta_scores, normalization_stats
+from src.distance_matrix import can_score_from_distance_matrix, score_from_distance_matrix
+from src.h3_geometry import cell_centers
+
+
+# Offline store of accessibility scores for every cell in the coverage area.
+# Layout (one .npy per column so each can be memory-mapped on its own):
+#   store_dir/meta.json                      resolution, POI fingerprint, columns
+#   store_dir/hex_ids.npy                    sorted H3 cells as uint64
+#   store_dir/lat.npy, lon.npy               cell centers
+#   store_dir/car/<poi_type>_accessibility.npy
+#   store_dir/no_car/<poi_type>_accessibility.npy
+
+DEFAULT_STORE_DIR = "data/output_data/accessibility_store"
+
+# Scores are stored at the base resolution; coarser pyramid levels are
+# aggregated from their children, finer ones are computed on demand.
+PYRAMID_BASE_RESOLUTION = 8
+PYRAMID_RESOLUTIONS = (7, 8, 9)
+TRANSIT_COLUMN_PREFIX = 'transit_accessibility' # no_car columns written by src.transit
+
+
+def _vehicle_dir(has_car):
+    return "car" if has_car else "no_car"
+
+
+def coverage_hexagons(df_pois, resolution=8):
+    """
+    All H3 cells (at resolution) covering the bounding box of the POI data.
+    """
+    lat_min, lat_max = df_pois['lat'].min(), df_pois['lat'].max()
+    lon_min, lon_max = df_pois['lon'].min(), df_pois['lon'].max()
+    bbox = h3.LatLngPoly([
+        (lat_min, lon_min),
+        (lat_min, lon_max),
+        (lat_max, lon_max),
+        (lat_max, lon_min),
+    ])
+    hexagons = h3.h3shape_to_cells(bbox, resolution)
+    print(f"Coverage area: {len(hexagons)} hexagons at resolution {resolution}")
+    return hexagons
+
+
+def build_accessibility_store(df_pois, store_dir=DEFAULT_STORE_DIR, resolution=8, poi_bin_resolution=None):
+    """
+    Score every cell of the coverage area for both has_car configurations
+    and write the result as a columnar, memory-mappable store.
+    poi_bin_resolution: score H3-binned POIs, as calculate_accessibility_scores
+    does; recorded in the meta so the store only serves requests binned alike.
+    """
+    hexagons = coverage_hexagons(df_pois, resolution)
+    hex_ints = np.array([h3.str_to_int(hex_id) for hex_id in hexagons], dtype=np.uint64)
+    order = np.argsort(hex_ints)
+    hexagons = [hexagons[i] for i in order]
+
+    os.makedirs(store_dir, exist_ok=True)
+    np.save(os.path.join(store_dir, "hex_ids.npy"), hex_ints[order])
+
+    poi_index = get_poi_index(df_pois)
+    columns = {}
+    for has_car in (True, False):
+        df_scores = calculate_accessibility_scores(
+            hexagons, df_pois, has_car, poi_index=poi_index, poi_bin_resolution=poi_bin_resolution
+        )
+        if has_car:
+            np.save(os.path.join(store_dir, "lat.npy"), df_scores['lat'].to_numpy(dtype=float))
+            np.save(os.path.join(store_dir, "lon.npy"), df_scores['lon'].to_numpy(dtype=float))
+
+        vehicle_dir = os.path.join(store_dir, _vehicle_dir(has_car))
+        os.makedirs(vehicle_dir, exist_ok=True)
+        score_columns = [f"{poi_type}_accessibility" for poi_type in get_poi_types_config(has_car)]
+        for col in score_columns:
+            np.save(os.path.join(vehicle_dir, f"{col}.npy"), df_scores[col].to_numpy(dtype=float))
+        columns[_vehicle_dir(has_car)] = score_columns
+
+    meta = {
+        'resolution': resolution,
+        'n_hexagons': len(hexagons),
+        'poi_fingerprint': fingerprint_pois(df_pois),
+        'poi_bin_resolution': poi_bin_resolution,
+        'columns': columns,
+    }
+    with open(os.path.join(store_dir, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=4)
+
+    print(f"Saved accessibility store for {len(hexagons)} hexagons: {store_dir}")
+    return meta
+
+
+def load_accessibility_store(store_dir=DEFAULT_STORE_DIR):
+    """
+    Memory-map a store written by build_accessibility_store.
+    Returns None if no store has been built yet.
+    """
+    meta_path = os.path.join(store_dir, "meta.json")
+    if not os.path.exists(meta_path):
+        print(f"No accessibility store found at {store_dir}")
+        return None
+
+    with open(meta_path) as f:
+        meta = json.load(f)
+
+    def _map(*parts):
+        return np.load(os.path.join(store_dir, *parts), mmap_mode='r')
+
+    store = {
+        'meta': meta,
+        'hex_ids': _map("hex_ids.npy"),
+        'lat': _map("lat.npy"),
+        'lon': _map("lon.npy"),
+        'columns': {
+            vehicle_dir: {col: _map(vehicle_dir, f"{col}.npy") for col in cols}
+            for vehicle_dir, cols in meta['columns'].items()
+        },
+    }
+    print(f"Mapped accessibility store with {meta['n_hexagons']} hexagons from {store_dir}")
+    return store
+
+
+def lookup_accessibility_scores(store, hexagons, has_car):
+    """
+    Slice the store by hex set.
+    Returns (df_found, missing): scores for the stored hexagons, in request
+    order, and the list of hexagons the store does not cover.
+    """
+    hex_ints = np.array([h3.str_to_int(hex_id) for hex_id in hexagons], dtype=np.uint64)
+    stored = store['hex_ids']
+    if len(stored) == 0:
+        return pd.DataFrame(), list(hexagons)
+
+    pos = np.minimum(np.searchsorted(stored, hex_ints), len(stored) - 1)
+    found = stored[pos] == hex_ints
+    rows = pos[found]
+
+    df_found = pd.DataFrame({
+        'hex_id': [hex_id for hex_id, hit in zip(hexagons, found) if hit],
+        'lat': store['lat'][rows],
+        'lon': store['lon'][rows],
+    })
+    for col, values in store['columns'][_vehicle_dir(has_car)].items():
+        df_found[col] = values[rows]
+
+    missing = [hex_id for hex_id, hit in zip(hexagons, found) if not hit]
+    return df_found, missing
+
+
+def update_accessibility_store(df_pois_updated, store_dir=DEFAULT_STORE_DIR, added_pois=None, removed_pois=None):
+    """
+    Apply a POI delta to the store in place: only cells within each type's
+    max_distance_km of a changed POI are touched, instead of a full rebuild.
+    df_pois_updated is the POI data after the change; its fingerprint is
+    recorded so the app keeps trusting the store.
+    """
+    with open(os.path.join(store_dir, "meta.json")) as f:
+        meta = json.load(f)
+    if meta.get('poi_bin_resolution') is not None:
+        # a POI moves the count-weighted centroid of its bin, which a point delta cannot express
+        raise ValueError("Incremental updates need a store of raw POIs; rebuild the binned store instead")
+
+    lats = np.load(os.path.join(store_dir, "lat.npy"), mmap_mode='r')
+    lons = np.load(os.path.join(store_dir, "lon.npy"), mmap_mode='r')
+
+    for has_car in (True, False):
+        vehicle_dir = os.path.join(store_dir, _vehicle_dir(has_car))
+        deltas = poi_delta_scores(lats, lons, get_poi_types_config(has_car), added_pois, removed_pois)
+        for col, delta in deltas.items():
+            changed = np.nonzero(delta)[0]
+            if len(changed) == 0:
+                continue
+            values = np.load(os.path.join(vehicle_dir, f"{col}.npy"), mmap_mode='r+')
+            values[changed] += delta[changed]
+            values.flush()
+            print(f"  {_vehicle_dir(has_car)}/{col}: updated {len(changed)} hexagons")
+
+    # transit reachability counts POIs but cannot be patched by decay deltas:
+    # drop it until `python -m src.transit` rebuilds it for the new POIs
+    stale_columns = [col for col in meta['columns']['no_car'] if col.startswith(TRANSIT_COLUMN_PREFIX)]
+    for col in stale_columns:
+        meta['columns']['no_car'].remove(col)
+        os.remove(os.path.join(store_dir, "no_car", f"{col}.npy"))
+    if stale_columns:
+        print(f"  no_car: dropped stale transit columns {stale_columns}, re-run python -m src.transit")
+
+    meta['poi_fingerprint'] = fingerprint_pois(df_pois_updated)
+    with open(os.path.join(store_dir, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=4)
+    return meta
+
+
+def citywide_normalization(store, has_car, method='minmax', percentiles=(1, 99)):
+    """
+    Normalization bounds of every stored column over the whole coverage area,
+    for apply_user_weights(normalization=...). None if no store has been built.
+    """
+    if store is None:
+        return None
+    columns = store['columns'][_vehicle_dir(has_car)]
+    return normalization_stats(
+        {col: np.asarray(values) for col, values in columns.items()}, method, percentiles
+    )
+
+
+def _store_is_usable(store, df_pois, poi_types_config, poi_bin_resolution=None):
+    # the store only holds the default configs, for the POI data and binning it was built with
+    if store is None or poi_types_config is not None:
+        return False
+    if store['meta']['poi_fingerprint'] != fingerprint_pois(df_pois):
+        print("Accessibility store is stale (POI data changed), recomputing scores")
+        return False
+    if store['meta'].get('poi_bin_resolution') != poi_bin_resolution:
+        print(f"Accessibility store was built with POI bins at {store['meta'].get('poi_bin_resolution')}, "
+              f"request uses {poi_bin_resolution}, recomputing scores")
+        return False
+    return True
+
+
+def get_accessibility_scores(hexagons, df_pois, has_car, store=None, poi_types_config=None,
+                             distance_matrix=None, **kwargs):
+    """
+    Serve accessibility scores from the precomputed store when possible and
+    only compute the hexagons it does not cover.
+    The store is skipped for custom configs or when the POI data has changed
+    since it was built; custom configs are evaluated over the precomputed
+    distance_matrix instead when it covers the request. Both only hold
+    exact straight-line scores, so network and approximate (fft) scoring
+    always compute. Both are only used when built with the request's
+    poi_bin_resolution, so one response never mixes binned and raw POIs.
+    """
+    if kwargs.get('method') in ('network', 'fft'):
+        store = distance_matrix = None
+    poi_bin_resolution = kwargs.get('poi_bin_resolution')
+    if poi_types_config is not None and can_score_from_distance_matrix(
+            distance_matrix, df_pois, hexagons, poi_types_config, poi_bin_resolution=poi_bin_resolution):
+        print("Scoring custom config from the precomputed distance matrix")
+        return score_from_distance_matrix(distance_matrix, hexagons, poi_types_config)
+
+    if not _store_is_usable(store, df_pois, poi_types_config, poi_bin_resolution):
+        return calculate_accessibility_scores(hexagons, df_pois, has_car, poi_types_config=poi_types_config, **kwargs)
+
+    df_found, missing = lookup_accessibility_scores(store, hexagons, has_car)
+    print(f"Accessibility store: {len(df_found)} hexagons from store, {len(missing)} to compute")
+    if not missing:
+        return df_found
+
+    df_missing = calculate_accessibility_scores(missing, df_pois, has_car, **kwargs)
+    df_hexagons = pd.concat([df_found, df_missing], ignore_index=True)
+    # keep the request's hexagon order
+    df_hexagons = df_hexagons.set_index('hex_id').loc[list(hexagons)].reset_index()
+    return df_hexagons
+
+
+def resolution_for_zoom(zoom):
+    """
+    Map a web map zoom level to the pyramid resolution whose cells are
+    still a few pixels wide at that zoom.
+    """
+    if zoom <= 10:
+        return 7
+    if zoom <= 12:
+        return 8
+    return 9
+
+
+def pyramid_hexagons(hexagons, resolution):
+    """
+    Re-express a set of base-resolution hexagons at another pyramid level:
+    their distinct parents when coarser, all their children when finer.
+    """
+    if resolution == PYRAMID_BASE_RESOLUTION:
+        return list(hexagons)
+    if resolution < PYRAMID_BASE_RESOLUTION:
+        return list(dict.fromkeys(h3.cell_to_parent(hex_id, resolution) for hex_id in hexagons))
+    return [child for hex_id in hexagons for child in h3.cell_to_children(hex_id, resolution)]
+
+
+def aggregate_scores_to_parent(df_scores, resolution):
+    """
+    Average the accessibility columns of child hexagons into their parent
+    cell at the given (coarser) resolution; lat/lon become the parent center.
+    """
+    score_columns = [col for col in df_scores.columns if col.endswith('_accessibility') or col.startswith(TRANSIT_COLUMN_PREFIX)]
+    parents = [h3.cell_to_parent(hex_id, resolution) for hex_id in df_scores['hex_id']]
+    df_parents = df_scores[score_columns].groupby(pd.Series(parents, index=df_scores.index, name='hex_id')).mean()
+    df_parents = df_parents.reset_index()
+
+    parent_lats, parent_lons = cell_centers(df_parents['hex_id'])
+    df_parents.insert(1, 'lat', parent_lats)
+    df_parents.insert(2, 'lon', parent_lons)
+    return df_parents
+
+
+def materialize_coarser_level(store, resolution):
+    """
+    Aggregate a base-resolution store into an in-memory store at a coarser
+    resolution, with the same layout so lookup_accessibility_scores works on it.
+    Only parents whose children are all in the store are materialized; parents
+    on the edge of the coverage area are left to be computed on demand.
+    """
+    base_resolution = store['meta']['resolution']
+    parents = np.array([h3_int.cell_to_parent(int(c), resolution) for c in store['hex_ids']], dtype=np.uint64)
+    cells, inverse, counts = np.unique(parents, return_inverse=True, return_counts=True)
+    expected = np.array([h3_int.cell_to_children_size(int(c), base_resolution) for c in cells])
+    complete = counts == expected
+
+    centers = [h3_int.cell_to_latlng(int(c)) for c in cells[complete]]
+    level = {
+        'meta': {**store['meta'], 'resolution': resolution, 'n_hexagons': int(complete.sum())},
+        'hex_ids': cells[complete],
+        'lat': np.array([lat for lat, _ in centers], dtype=float),
+        'lon': np.array([lon for _, lon in centers], dtype=float),
+        'columns': {},
+    }
+    for vehicle_dir, cols in store['columns'].items():
+        level['columns'][vehicle_dir] = {
+            col: (np.bincount(inverse, weights=values, minlength=len(cells)) / counts)[complete]
+            for col, values in cols.items()
+        }
+    return level
+
+
+def build_accessibility_pyramid(store, coarser_resolutions=(7,)):
+    """
+    Pyramid of stores keyed by resolution: the mapped base store plus the
+    coarser levels aggregated from it. Empty if no store has been built.
+    """
+    if store is None:
+        return {}
+    pyramid = {store['meta']['resolution']: store}
+    for resolution in coarser_resolutions:
+        pyramid[resolution] = materialize_coarser_level(store, resolution)
+        print(f"Materialized pyramid level {resolution} with {pyramid[resolution]['meta']['n_hexagons']} hexagons")
+    return pyramid
+
+
+def get_pyramid_scores(hexagons, df_pois, has_car, resolution=PYRAMID_BASE_RESOLUTION, pyramid=None,
+                       poi_types_config=None, **kwargs):
+    """
+    Accessibility scores for hexagons at any pyramid resolution.
+    Base and finer levels are served like get_accessibility_scores (finer cells
+    are always computed, and then cached). Coarser cells come from the
+    materialized level, and the rest are aggregated from their base-resolution children.
+    """
+    pyramid = pyramid or {}
+    if kwargs.get('method') in ('network', 'fft'):
+        pyramid = {}  # materialized levels hold exact straight-line scores
+    if resolution >= PYRAMID_BASE_RESOLUTION:
+        return get_accessibility_scores(
+            hexagons, df_pois, has_car, store=pyramid.get(resolution), poi_types_config=poi_types_config, **kwargs
+        )
+
+    level = pyramid.get(resolution)
+    if _store_is_usable(level, df_pois, poi_types_config, kwargs.get('poi_bin_resolution')):
+        df_found, missing = lookup_accessibility_scores(level, hexagons, has_car)
+    else:
+        df_found, missing = pd.DataFrame(), list(hexagons)
+    print(f"Pyramid level {resolution}: {len(df_found)} hexagons materialized, {len(missing)} to aggregate")
+    if not missing:
+        return df_found
+
+    children = [child for hex_id in missing for child in h3.cell_to_children(hex_id, PYRAMID_BASE_RESOLUTION)]
+    df_children = get_accessibility_scores(
+        children, df_pois, has_car, store=pyramid.get(PYRAMID_BASE_RESOLUTION),
+        poi_types_config=poi_types_config, **kwargs
+    )
+    df_missing = aggregate_scores_to_parent(df_children, resolution)
+    df_hexagons = pd.concat([df_found, df_missing], ignore_index=True)
+    df_hexagons = df_hexagons.set_index('hex_id').loc[list(hexagons)].reset_index()
+    return df_hexagons
+
+
+if __name__ == '__main__':
+    # Offline build step: python -m src.accessibility_store
+    from src.fetch_csv_data import load_pois
+    # POI_BIN_RESOLUTION must match the app's, or the app will not serve the store
+    poi_bin_resolution = int(os.environ["POI_BIN_RESOLUTION"]) if os.environ.get("POI_BIN_RESOLUTION") else None
+    build_accessibility_store(load_pois(), poi_bin_resolution=poi_bin_resolution)
@@ -1,4 +1,5 @@
 import sys
+import hashlib
 import requests
 import pandas as pd
 import geopandas as gpd
@@ -8,10 +9,14 @@ import json
 import time
 import numpy as np
 import h3
+import h3.api.numpy_int as h3_int
 from folium.plugins import HeatMap
 from sklearn.preprocessing import StandardScaler
 from sklearn.cluster import KMeans, DBSCAN
 from sklearn.preprocessing import MinMaxScaler
+from sklearn.neighbors import KDTree
+from src.h3_geometry import cell_centers, grid_disk_pairs
+from src.poi_index import project_coordinates
 
 
 #load budget data
@@ -24,55 +29,156 @@ def load_budget_data(file_name):
 
 
 
-# fucntion to convert lat long budget data to hex grids with same resolution as poi hex grids
-def convert_rent_data_to_h3(df_budget, resolution=8):
-    hex_budget_list = []
-    for _,r in df_budget.iterrows():
-        lat = r['lat']
-        lon = r['lon']
-        budget = r['avg_rent_est']
+RENT_IMPUTATION_METHODS = ('median', 'idw')
 
-        hex_id = h3.latlng_to_cell(lat, lon, resolution)
-        hex_budget_list.append({'hex_id': hex_id, 'avg_rent': budget})
+_RENT_SURFACE_CACHE = {} # (rent fingerprint, resolution) -> mean rent per hex
+_IMPUTED_RENT_CACHE = {} # (rent fingerprint, resolution, K, method) -> rent of every coverage hex
 
-    df_budget_hex = pd.DataFrame(hex_budget_list)
-    df_budget_hex = df_budget_hex.groupby('hex_id').agg({'avg_rent':'mean'}).reset_index()
-    return df_budget_hex
 
+def fingerprint_rent(df_budget):
+    """
+    Stable hash of the rent dataset (lat, lon, avg_rent_est): its version for
+    as long as the rent data does not change.
+    """
+    row_hashes = pd.util.hash_pandas_object(df_budget[['lat', 'lon', 'avg_rent_est']], index=False)
+    return hashlib.sha1(row_hashes.to_numpy().tobytes()).hexdigest()
 
-#impute rent
-def get_nearest_rent(df_budget_hex, hexagons, K=3):
 
+# fucntion to convert lat long budget data to hex grids with same resolution as poi hex grids
+def convert_rent_data_to_h3(df_budget, resolution=8):
+    """
+    Mean avg_rent_est per hex: every rent point is assigned a cell in one
+    pass, then sums and counts per cell are aggregated with bincount.
+    """
+    lats = df_budget['lat'].to_numpy(dtype=float)
+    lons = df_budget['lon'].to_numpy(dtype=float)
+    rents = df_budget['avg_rent_est'].to_numpy(dtype=float)
+    cells = np.array([h3_int.latlng_to_cell(lat, lon, resolution) for lat, lon in zip(lats, lons)], dtype=np.uint64)
+
+    unique_cells, inverse = np.unique(cells, return_inverse=True)
+    # missing rents are skipped, like groupby mean
+    known = ~np.isnan(rents)
+    sums = np.bincount(inverse[known], weights=rents[known], minlength=len(unique_cells))
+    counts = np.bincount(inverse[known], minlength=len(unique_cells))
+    mean_rent = np.divide(sums, counts, out=np.full(len(unique_cells), np.nan), where=counts > 0)
+
+    return pd.DataFrame({
+        'hex_id': [h3_int.int_to_str(int(cell)) for cell in unique_cells],
+        'avg_rent': mean_rent,
+    })
+
+
+def get_rent_surface(df_budget, resolution=8):
+    """
+    Memoized convert_rent_data_to_h3: built once per rent dataset version and
+    resolution. Callers get a copy, the cached frame is never modified.
+    """
+    surface_key = (fingerprint_rent(df_budget), resolution)
+    if surface_key not in _RENT_SURFACE_CACHE:
+        _RENT_SURFACE_CACHE[surface_key] = convert_rent_data_to_h3(df_budget, resolution=resolution)
+    return _RENT_SURFACE_CACHE[surface_key].copy()
+
+
+def precompute_rent_surfaces(df_budget, resolutions=(8,)):
+    """Build the rent surface of every served resolution up front (e.g. at startup)."""
+    for resolution in resolutions:
+        get_rent_surface(df_budget, resolution=resolution)
+    print(f"Precomputed rent surfaces for resolutions {list(resolutions)}")
 
-    # Known rent hexes
-    known = df_budget_hex[['hex_id', 'avg_rent']].copy()
 
+#impute rent
+def impute_rent(df_budget_hex, hexagons, K=3, method='median', power=2):
+    """
+    Rent estimate of each hexagon from the K nearest hexes with known rent,
+    found with one KD-tree query over cell centroids (in the scoring km space).
+    method: 'median' of the K rents, or 'idw' (inverse-distance weighted mean,
+    weights 1 / km**power).
+    """
+    if method not in RENT_IMPUTATION_METHODS:
+        raise ValueError(f"Unknown rent imputation method {method!r}, expected one of {RENT_IMPUTATION_METHODS}")
+    known = df_budget_hex.dropna(subset=['avg_rent'])
+    if len(hexagons) == 0 or len(known) == 0:
+        return np.full(len(hexagons), np.nan)
+
+    known_lats, known_lons = cell_centers(known['hex_id'])
+    tree = KDTree(project_coordinates(known_lats, known_lons))
+    lats, lons = cell_centers(hexagons)
+    dists, ind = tree.query(project_coordinates(lats, lons), k=min(K, len(known)))
+    rents = known['avg_rent'].to_numpy(dtype=float)[ind]
+
+    if method == 'median':
+        return np.median(rents, axis=1)
+    weights = 1 / np.maximum(dists, 1e-6) ** power
+    return (rents * weights).sum(axis=1) / weights.sum(axis=1)
+
+
+def get_nearest_rent(df_budget_hex, hexagons, K=3, method='median'):
+    """
+    avg_rent of each hexagon: its own mean rent when known, otherwise imputed
+    from the K nearest known hexes (see impute_rent).
+    """
     # Prepare output df
     out = pd.DataFrame({'hex_id': hexagons})
     out = out.merge(df_budget_hex[['hex_id', 'avg_rent']], 
                     on='hex_id', how='left')
 
-    # Function to impute a single hex
-    def impute_single_hex(target_hex):
-        # compute distances to all known-rent hexes
-        known['dist'] = known['hex_id'].apply(
-            lambda x: h3.grid_distance(target_hex, x)
-        )
+    # Impute only the missing rents
+    missing = out['avg_rent'].isnull().to_numpy()
+    if missing.any():
+        out.loc[missing, 'avg_rent'] = impute_rent(df_budget_hex, out.loc[missing, 'hex_id'], K=K, method=method)
 
-        # pick top-K nearest neighbors
-        nearest = known.sort_values('dist').head(K)
+    return out
 
-        # imputation method = median of nearest K (you can change)
-        return nearest['avg_rent'].median()
 
-    # Apply only on missing rents
-    out.loc[out.avg_rent.isnull(), 'avg_rent'] = (
-        out.loc[out.avg_rent.isnull(), 'hex_id'].apply(impute_single_hex)
-    )
+def precompute_imputed_rent(df_budget, coverage_by_resolution, K=1, method='median'):
+    """
+    Rent (known or imputed) of every coverage hex, once per rent dataset version,
+    so requests inside the coverage area are a lookup.
+    coverage_by_resolution: {resolution: hex ids} (e.g. the pyramid levels).
+    """
+    rent_fingerprint = fingerprint_rent(df_budget)
+    for resolution, hexagons in coverage_by_resolution.items():
+        surface_key = (rent_fingerprint, resolution, K, method)
+        if surface_key not in _IMPUTED_RENT_CACHE:
+            df_surface = get_nearest_rent(get_rent_surface(df_budget, resolution), hexagons, K=K, method=method)
+            _IMPUTED_RENT_CACHE[surface_key] = df_surface.set_index('hex_id')['avg_rent']
+        print(f"Imputed rent surface at resolution {resolution}: {len(_IMPUTED_RENT_CACHE[surface_key])} hexagons")
+
+
+def get_imputed_rent(df_budget, hexagons, resolution=8, K=1, method='median'):
+    """
+    Same result as get_nearest_rent over the rent surface at this resolution:
+    read from the precomputed surface, imputing only hexagons outside it.
+    """
+    rent_fingerprint = fingerprint_rent(df_budget)
+    surface = _IMPUTED_RENT_CACHE.get((rent_fingerprint, resolution, K, method))
+    if surface is None:
+        return get_nearest_rent(get_rent_surface(df_budget, resolution), hexagons, K=K, method=method)
 
+    out = pd.DataFrame({'hex_id': hexagons})
+    out['avg_rent'] = surface.reindex(out['hex_id']).to_numpy()
+    outside = ~out['hex_id'].isin(surface.index).to_numpy()
+    if outside.any():
+        df_outside = get_nearest_rent(get_rent_surface(df_budget, resolution), out.loc[outside, 'hex_id'], K=K, method=method)
+        out.loc[outside, 'avg_rent'] = df_outside['avg_rent'].to_numpy()
     return out
 
 
+def plan_budget_pushdown(df_rent_hex, max_budget, neighbor_rings=1):
+    """
+    Hexagons worth scoring for a budget: the affordable ones plus every cell
+    within neighbor_rings of them, so spatial smoothing (k rings x iterations)
+    of the affordable cells sees exactly the neighbors it would unpruned.
+    df_rent_hex: hex_id + avg_rent of the whole request area.
+    Returns the hex ids to score, in the order of df_rent_hex.
+    """
+    affordable = df_rent_hex.loc[df_rent_hex['avg_rent'] <= max_budget, 'hex_id'].to_numpy()
+    _, ring_cells, _ = grid_disk_pairs(affordable, k=neighbor_rings)
+    keep = df_rent_hex['hex_id'].isin(np.concatenate([affordable, ring_cells]))
+    print(f"Budget pushdown: {len(affordable)} affordable hexagons, scoring {int(keep.sum())} of {len(df_rent_hex)}")
+    return df_rent_hex.loc[keep, 'hex_id'].tolist()
+
+
 #merge budget with accesibility scores
 def merge_budget_with_accessibility(df_hexagons, df_budget_hex):
     print(f"Merging budget data with {len(df_budget_hex)} with accessibility data with {len(df_hexagons)}")
@@ -12,6 +12,7 @@ from folium.plugins import HeatMap
 from sklearn.preprocessing import StandardScaler
 from sklearn.cluster import KMeans, DBSCAN
 from sklearn.preprocessing import MinMaxScaler
+from src.h3_geometry import cell_centers
 
 
 def calculate_max_min_coordinates(center, radius_km):
@@ -108,18 +109,13 @@ def create_hex_grids_with_radius(df_pois, radius_km, center = (33.749, -84.388),
     
     # Filter by circular boundary if specified
 
-    filtered_hexagons = []
     center_lat, center_lon = center
-    
-    for hex_id in hexagons:
-        hex_lat, hex_lon = h3.cell_to_latlng(hex_id)
-        # Calculate distance from center
-        lat_diff = abs(hex_lat - center_lat)
-        lon_diff = abs(hex_lon - center_lon)
-        distance_km = np.sqrt(lat_diff**2 + lon_diff**2) * 111
-        
-        if distance_km <= radius_km:
-            filtered_hexagons.append(hex_id)
+    hex_lats, hex_lons = cell_centers(hexagons)
+    # Calculate distance from center
+    lat_diff = np.abs(hex_lats - center_lat)
+    lon_diff = np.abs(hex_lons - center_lon)
+    distance_km = np.sqrt(lat_diff**2 + lon_diff**2) * 111
+    filtered_hexagons = [hex_id for hex_id, inside in zip(hexagons, distance_km <= radius_km) if inside]
     
     print(f"Filtered to {len(filtered_hexagons)} hexagons within {radius_km} km of center")
     hexagons = filtered_hexagons
@@ -0,0 +1,173 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+import h3
+import scipy.sparse as sp
+from src.poi_index import fingerprint_pois, get_binned_pois, get_poi_index, project_coordinates
+from src.h3_geometry import cell_centers
+
+
+# Precomputed sparse hex x POI distances, so any decay_rate / max_distance_km / invert
+# combination up to the stored cutoff is evaluated with vectorized math only.
+# Layout:
+#   matrix_dir/meta.json           POI fingerprint, POI bin resolution, cutoff, types
+#   matrix_dir/hex_ids.npy         sorted H3 cells as uint64 (matrix rows)
+#   matrix_dir/lat.npy, lon.npy    cell centers
+#   matrix_dir/<type>.npz          CSR matrix, one column per POI of that type
+
+DEFAULT_DISTANCE_MATRIX_DIR = "data/output_data/distance_matrix"
+DISTANCE_MATRIX_MAX_KM = 20  # largest cutoff used by any default config
+
+
+def build_distance_matrix(df_pois, hexagons, max_distance_km=DISTANCE_MATRIX_MAX_KM, poi_bin_resolution=None):
+    """
+    Sparse hex x POI distance matrix per POI type, holding every pair within max_distance_km.
+    Entries store 1 + distance_km (so a POI exactly at a hex center is not an
+    implicit zero) as float32; weights of aggregated POIs are kept per column.
+    poi_bin_resolution: columns are H3 POI bins instead of raw POIs.
+    Returns dict: {'hex_ids', 'lat', 'lon', 'max_distance_km', 'poi_fingerprint',
+                   'poi_bin_resolution', 'types': type -> {'matrix', 'weight'}}
+    """
+    hex_ints = np.array([h3.str_to_int(hex_id) for hex_id in hexagons], dtype=np.uint64)
+    order = np.argsort(hex_ints)
+    hex_lats, hex_lons = cell_centers([hexagons[i] for i in order])
+
+    matrix = {
+        'hex_ids': hex_ints[order],
+        'lat': hex_lats,
+        'lon': hex_lons,
+        'max_distance_km': max_distance_km,
+        'poi_fingerprint': fingerprint_pois(df_pois),
+        'poi_bin_resolution': poi_bin_resolution,
+        'types': {},
+    }
+    if poi_bin_resolution is not None:
+        df_pois = get_binned_pois(df_pois, resolution=poi_bin_resolution)
+    poi_index = get_poi_index(df_pois)
+
+    for poi_type, entry in poi_index.items():
+        ind, dists = entry['tree'].query_radius(
+            project_coordinates(hex_lats, hex_lons), r=max_distance_km, return_distance=True
+        )
+        counts = np.array([len(d) for d in dists])
+        indptr = np.concatenate([[0], np.cumsum(counts)])
+        cols = np.concatenate(ind) if counts.sum() else np.zeros(0, dtype=int)
+        data = (1 + np.concatenate(dists)).astype(np.float32) if counts.sum() else np.zeros(0, dtype=np.float32)
+        matrix['types'][poi_type] = {
+            'matrix': sp.csr_matrix((data, cols, indptr), shape=(len(hex_lats), len(entry['lat']))),
+            'weight': entry['weight'],
+        }
+        print(f"  {poi_type}: {len(data)} hex-POI pairs within {max_distance_km} km")
+
+    return matrix
+
+
+def save_distance_matrix(matrix, matrix_dir=DEFAULT_DISTANCE_MATRIX_DIR):
+    os.makedirs(matrix_dir, exist_ok=True)
+    np.save(os.path.join(matrix_dir, "hex_ids.npy"), matrix['hex_ids'])
+    np.save(os.path.join(matrix_dir, "lat.npy"), matrix['lat'])
+    np.save(os.path.join(matrix_dir, "lon.npy"), matrix['lon'])
+    for poi_type, entry in matrix['types'].items():
+        sp.save_npz(os.path.join(matrix_dir, f"{poi_type}.npz"), entry['matrix'])
+        np.save(os.path.join(matrix_dir, f"{poi_type}_weight.npy"), entry['weight'])
+
+    meta = {
+        'max_distance_km': matrix['max_distance_km'],
+        'poi_fingerprint': matrix['poi_fingerprint'],
+        'poi_bin_resolution': matrix['poi_bin_resolution'],
+        'types': list(matrix['types']),
+    }
+    with open(os.path.join(matrix_dir, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=4)
+    print(f"Saved distance matrix for {len(matrix['hex_ids'])} hexagons: {matrix_dir}")
+
+
+def load_distance_matrix(matrix_dir=DEFAULT_DISTANCE_MATRIX_DIR):
+    """
+    Load a matrix written by save_distance_matrix; None if it was never built.
+    """
+    meta_path = os.path.join(matrix_dir, "meta.json")
+    if not os.path.exists(meta_path):
+        print(f"No distance matrix found at {matrix_dir}")
+        return None
+
+    with open(meta_path) as f:
+        meta = json.load(f)
+
+    matrix = {
+        'hex_ids': np.load(os.path.join(matrix_dir, "hex_ids.npy")),
+        'lat': np.load(os.path.join(matrix_dir, "lat.npy")),
+        'lon': np.load(os.path.join(matrix_dir, "lon.npy")),
+        'max_distance_km': meta['max_distance_km'],
+        'poi_fingerprint': meta['poi_fingerprint'],
+        'poi_bin_resolution': meta.get('poi_bin_resolution'),
+        'types': {
+            poi_type: {
+                'matrix': sp.load_npz(os.path.join(matrix_dir, f"{poi_type}.npz")).tocsr(),
+                'weight': np.load(os.path.join(matrix_dir, f"{poi_type}_weight.npy")),
+            }
+            for poi_type in meta['types']
+        },
+    }
+    print(f"Loaded distance matrix with {len(matrix['hex_ids'])} hexagons from {matrix_dir}")
+    return matrix
+
+
+def can_score_from_distance_matrix(matrix, df_pois, hexagons, poi_types_config, poi_bin_resolution=None):
+    """
+    True if every requested hexagon is a matrix row, the POI data and binning
+    are unchanged and no cutoff in the config exceeds the stored one.
+    """
+    if matrix is None or matrix['poi_fingerprint'] != fingerprint_pois(df_pois):
+        return False
+    if matrix.get('poi_bin_resolution') != poi_bin_resolution:
+        return False
+    if any(config['max_distance_km'] > matrix['max_distance_km'] for config in poi_types_config.values()):
+        return False
+    hex_ints = np.array([h3.str_to_int(hex_id) for hex_id in hexagons], dtype=np.uint64)
+    return bool(np.all(np.isin(hex_ints, matrix['hex_ids'])))
+
+
+def score_from_distance_matrix(matrix, hexagons, poi_types_config):
+    """
+    Evaluate any decay config over the stored distances: slice the requested
+    rows, apply cutoff / decay / invert to the nonzeros and sum each row.
+    Returns the same frame layout as calculate_accessibility_scores.
+    """
+    hex_ints = np.array([h3.str_to_int(hex_id) for hex_id in hexagons], dtype=np.uint64)
+    rows = np.searchsorted(matrix['hex_ids'], hex_ints)
+
+    df_hexagons = pd.DataFrame({
+        'hex_id': list(hexagons),
+        'lat': matrix['lat'][rows],
+        'lon': matrix['lon'][rows],
+    })
+
+    for poi_type, config in poi_types_config.items():
+        scores = np.zeros(len(rows))
+        for source_type in config['types']:
+            if source_type not in matrix['types']:
+                continue
+            entry = matrix['types'][source_type]
+            sub = entry['matrix'][rows]
+            distance_km = sub.data.astype(float) - 1
+            values = 1 / (1 + distance_km) ** config['decay_rate']
+            values[distance_km > config['max_distance_km']] = 0.0
+            weighted = sp.csr_matrix((values, sub.indices, sub.indptr), shape=sub.shape)
+            scores += weighted @ entry['weight']
+        if config.get('invert', False):
+            scores = -scores
+        df_hexagons[f"{poi_type}_accessibility"] = scores
+
+    return df_hexagons
+
+
+if __name__ == '__main__':
+    # Offline build step: python -m src.distance_matrix
+    from src.fetch_csv_data import load_pois
+    from src.accessibility_store import coverage_hexagons
+    df_pois = load_pois()
+    # POI_BIN_RESOLUTION must match the app's, or the app will not use the matrix
+    poi_bin_resolution = int(os.environ["POI_BIN_RESOLUTION"]) if os.environ.get("POI_BIN_RESOLUTION") else None
+    save_distance_matrix(build_distance_matrix(df_pois, coverage_hexagons(df_pois), poi_bin_resolution=poi_bin_resolution))
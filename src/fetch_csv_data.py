@@ -161,3 +161,20 @@ def load_rent():
     df_rent = pd.read_csv(file_to_read)
     return df_rent
 
+
+def iter_poi_chunks(file_to_read, chunk_rows=1_000_000, columns=('type', 'lat', 'lon')):
+    """
+    Stream a POI layer from disk in DataFrames of at most chunk_rows rows,
+    so layers larger than memory can be processed piece by piece.
+    Reads CSV, or Parquet (one record batch at a time; needs pyarrow).
+    """
+    columns = list(columns)
+    if file_to_read.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(file_to_read)
+        available = [col for col in columns if col in parquet_file.schema_arrow.names]
+        for batch in parquet_file.iter_batches(batch_size=chunk_rows, columns=available):
+            yield batch.to_pandas()
+    else:
+        for df_chunk in pd.read_csv(file_to_read, chunksize=chunk_rows, usecols=lambda col: col in columns):
+            yield df_chunk
@@ -0,0 +1,169 @@
+import threading
+import numpy as np
+import pandas as pd
+import h3
+
+
+MAX_BOUNDARY_VERTICES = 10  # distorted cells crossing icosahedron edges have up to 10
+MAX_GEOMETRY_CACHE_CELLS = 200_000  # ~0.6 kB per cell; least recently used cells are evicted beyond this
+
+
+class H3GeometryCache:
+    """
+    Array-backed geometry of H3 cells: centroid, boundary vertices and ring-1
+    neighbors, one row per cell. Cells are added in batches the first time
+    they are seen (or all at once for the coverage area), after which every
+    lookup is a dict join plus array indexing instead of per-cell h3 calls.
+    The arrays grow by doubling; past max_cells the least recently used rows
+    are freed in batches of max_cells // 8 and reused. Rows move on eviction,
+    so lookups go through take(), which copies the requested fields under the lock.
+    """
+
+    def __init__(self, max_cells=MAX_GEOMETRY_CACHE_CELLS):
+        self.max_cells = max_cells
+        self._lock = threading.Lock()
+        self._row_of = {}  # cell -> row
+        self._free_rows = []
+        self._n_rows = 0  # rows handed out so far; the arrays hold spare capacity beyond it
+        self._tick = 0
+        self.lat = np.zeros(0)
+        self.lon = np.zeros(0)
+        self.boundary = np.zeros((0, MAX_BOUNDARY_VERTICES, 2))  # (lat, lon), NaN padded
+        self.n_vertices = np.zeros(0, dtype=int)
+        self.neighbors = np.empty((0, 6), dtype=object)  # ring-1 cells, None where a pentagon has 5
+        self.last_used = np.zeros(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self._row_of)
+
+    def _grow(self, capacity):
+        def grown(array):
+            out = np.empty((capacity,) + array.shape[1:], dtype=array.dtype)
+            out[:len(array)] = array
+            return out
+        self.lat, self.lon, self.boundary = grown(self.lat), grown(self.lon), grown(self.boundary)
+        self.n_vertices, self.neighbors, self.last_used = grown(self.n_vertices), grown(self.neighbors), grown(self.last_used)
+
+    def _evict(self, count):
+        # least recently used rows first, never the ones the current call touched
+        cells = np.array(list(self._row_of), dtype=object)
+        rows = np.fromiter(self._row_of.values(), dtype=np.int64, count=len(cells))
+        stale = self.last_used[rows] < self._tick
+        cells, rows = cells[stale], rows[stale]
+        if count < len(rows):
+            oldest = np.argpartition(self.last_used[rows], count)[:count]
+            cells, rows = cells[oldest], rows[oldest]
+        for cell in cells:
+            del self._row_of[cell]
+        self.neighbors[rows] = None
+        self._free_rows.extend(rows.tolist())
+
+    def _add(self, hexagons):
+        excess = len(self._row_of) + len(hexagons) - self.max_cells
+        if excess > 0:
+            self._evict(excess + self.max_cells // 8)
+        reused = self._free_rows[len(self._free_rows) - min(len(hexagons), len(self._free_rows)):]
+        del self._free_rows[len(self._free_rows) - len(reused):]
+        n_new = len(hexagons) - len(reused)
+        if self._n_rows + n_new > len(self.lat):
+            self._grow(max(self._n_rows + n_new, 2 * len(self.lat)))
+        rows = np.concatenate([reused, np.arange(self._n_rows, self._n_rows + n_new)]).astype(np.int64)
+        self._n_rows += n_new
+
+        centers = [h3.cell_to_latlng(hex_id) for hex_id in hexagons]
+        boundaries = [h3.cell_to_boundary(hex_id) for hex_id in hexagons]
+        boundary = np.full((len(hexagons), MAX_BOUNDARY_VERTICES, 2), np.nan)
+        for row, vertices in enumerate(boundaries):
+            boundary[row, :len(vertices)] = vertices
+        neighbors = np.empty((len(hexagons), 6), dtype=object)
+        for row, hex_id in enumerate(hexagons):
+            ring = h3.grid_ring(hex_id, 1)
+            neighbors[row, :len(ring)] = ring
+
+        self.lat[rows] = [lat for lat, _ in centers]
+        self.lon[rows] = [lon for _, lon in centers]
+        self.boundary[rows] = boundary
+        self.n_vertices[rows] = [len(vertices) for vertices in boundaries]
+        self.neighbors[rows] = neighbors
+        self.last_used[rows] = self._tick
+        self._row_of.update(zip(hexagons, rows.tolist()))
+
+    def _rows(self, hexagons):
+        row_of = self._row_of
+        return np.fromiter((row_of.get(hex_id, -1) for hex_id in hexagons), dtype=np.int64, count=len(hexagons))
+
+    def take(self, hexagons, *fields):
+        """Copies of the named fields (e.g. 'lat', 'lon') for each cell, adding the cells not seen before."""
+        hexagons = list(hexagons)
+        with self._lock:
+            self._tick += 1
+            rows = self._rows(hexagons)
+            missing = rows < 0
+            if missing.any():
+                self.last_used[rows[~missing]] = self._tick
+                self._add(list(dict.fromkeys(hex_id for hex_id, absent in zip(hexagons, missing) if absent)))
+                rows = self._rows(hexagons)
+            self.last_used[rows] = self._tick
+            return tuple(getattr(self, field)[rows] for field in fields)
+
+
+_GEOMETRY_CACHE = H3GeometryCache() # process-wide table, shared by every module
+
+
+def get_geometry_cache():
+    return _GEOMETRY_CACHE
+
+
+def warm_geometry_cache(hexagons):
+    """Precompute geometry for a whole area (e.g. the store's coverage cells) in one batch."""
+    _GEOMETRY_CACHE.take(hexagons)
+    print(f"H3 geometry cache holds {len(_GEOMETRY_CACHE)} cells (max {_GEOMETRY_CACHE.max_cells})")
+
+
+def cell_centers(hexagons):
+    """Returns (lats, lons) arrays of the cell centers."""
+    return _GEOMETRY_CACHE.take(hexagons, 'lat', 'lon')
+
+
+def cell_boundary(hex_id):
+    """(lat, lon) boundary vertices of one cell, as an (n, 2) array."""
+    boundary, n_vertices = _GEOMETRY_CACHE.take([hex_id], 'boundary', 'n_vertices')
+    return boundary[0, :n_vertices[0]]
+
+
+def polygon_coords(hexagons):
+    """Closed [lon, lat] rings of the cells, as used by GeoJSON / pydeck polygons."""
+    boundary, n_vertices = _GEOMETRY_CACHE.take(hexagons, 'boundary', 'n_vertices')
+    boundary = boundary[:, :, ::-1]
+    return [
+        boundary[i, list(range(n)) + [0]].tolist()
+        for i, n in enumerate(n_vertices)
+    ]
+
+
+def grid_disk_pairs(hexagons, k=1):
+    """
+    Cells of rings 1..k around each cell, found by expanding the ring-1
+    neighbor table ring by ring.
+    Returns (source_positions, cells, rings): one entry per (cell, ring cell) pair.
+    """
+    sources = np.arange(len(hexagons))
+    seen = pd.DataFrame({'source': sources, 'cell': np.asarray(list(hexagons), dtype=object)})
+    frontier = seen
+    found = []
+    for ring in range(1, k + 1):
+        neighbors, = _GEOMETRY_CACHE.take(frontier['cell'], 'neighbors')
+        candidates = pd.DataFrame({
+            'source': np.repeat(frontier['source'].to_numpy(), 6),
+            'cell': neighbors.ravel(),
+        }).dropna().drop_duplicates()
+        # keep cells not already reached at a smaller ring
+        candidates = candidates.merge(seen, how='left', indicator=True)
+        frontier = candidates.loc[candidates['_merge'] == 'left_only', ['source', 'cell']]
+        seen = pd.concat([seen, frontier], ignore_index=True)
+        found.append(frontier.assign(ring=ring))
+
+    if not found:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=object), np.zeros(0, dtype=int)
+    pairs = pd.concat(found, ignore_index=True)
+    return pairs['source'].to_numpy(), pairs['cell'].to_numpy(), pairs['ring'].to_numpy()
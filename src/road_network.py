@@ -0,0 +1,145 @@
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy.sparse.csgraph import dijkstra
+from sklearn.neighbors import KDTree
+from src.poi_index import project_coordinates, fingerprint_pois
+
+
+# Road-graph extract prepared offline (e.g. exported from OSM with osmnx):
+#   network_dir/nodes.csv   node_id, lat, lon
+#   network_dir/edges.csv   u, v, length_km [, oneway]
+# Edges are traversable both ways unless oneway is true.
+
+DEFAULT_ROAD_NETWORK_DIR = "data/input_data/road_network"
+
+_DISTANCE_FIELD_CACHE = {} # (network, POI fingerprint, types, cutoff) -> km to nearest POI per node
+
+
+def load_road_network(network_dir=DEFAULT_ROAD_NETWORK_DIR):
+    """
+    Load a prepared edge list into a sparse graph plus a KD-tree over its nodes
+    for snapping. Returns None if no network has been prepared.
+    Returns dict: {'node_ids', 'lat', 'lon', 'graph', 'tree', 'fingerprint'}
+    """
+    nodes_path = os.path.join(network_dir, "nodes.csv")
+    edges_path = os.path.join(network_dir, "edges.csv")
+    if not (os.path.exists(nodes_path) and os.path.exists(edges_path)):
+        print(f"No road network found at {network_dir}")
+        return None
+
+    df_nodes = pd.read_csv(nodes_path)
+    df_edges = pd.read_csv(edges_path)
+
+    node_ids = df_nodes['node_id'].to_numpy()
+    position = pd.Series(np.arange(len(node_ids)), index=node_ids)
+    u = position.loc[df_edges['u']].to_numpy()
+    v = position.loc[df_edges['v']].to_numpy()
+    length_km = df_edges['length_km'].to_numpy(dtype=float)
+    oneway = df_edges['oneway'].fillna(False).astype(bool).to_numpy() if 'oneway' in df_edges else np.zeros(len(u), dtype=bool)
+
+    df_arcs = pd.DataFrame({
+        'row': np.concatenate([u, v[~oneway]]),
+        'col': np.concatenate([v, u[~oneway]]),
+        # csgraph drops explicit zeros, so zero-length edges get a tiny positive length
+        'length_km': np.maximum(np.concatenate([length_km, length_km[~oneway]]), 1e-6),
+    })
+    # parallel edges would be summed by the sparse constructor: keep the shortest
+    df_arcs = df_arcs.sort_values('length_km').drop_duplicates(['row', 'col'])
+    graph = sp.csr_matrix(
+        (df_arcs['length_km'].to_numpy(), (df_arcs['row'].to_numpy(), df_arcs['col'].to_numpy())),
+        shape=(len(node_ids), len(node_ids)),
+    )
+
+    lats = df_nodes['lat'].to_numpy(dtype=float)
+    lons = df_nodes['lon'].to_numpy(dtype=float)
+    network = {
+        'node_ids': node_ids,
+        'lat': lats,
+        'lon': lons,
+        'graph': graph,
+        'tree': KDTree(project_coordinates(lats, lons)),
+        'fingerprint': hashlib.sha1(
+            pd.util.hash_pandas_object(df_edges[['u', 'v', 'length_km']], index=False).to_numpy().tobytes()
+        ).hexdigest(),
+    }
+    print(f"Loaded road network with {len(node_ids)} nodes and {len(df_edges)} edges from {network_dir}")
+    return network
+
+
+def snap_to_nodes(network, lats, lons):
+    """
+    Nearest network node of each point.
+    Returns (node_positions, snap_distances_km) in the scoring kernel's km space.
+    """
+    if len(lats) == 0:
+        return np.zeros(0, dtype=int), np.zeros(0)
+    dists, ind = network['tree'].query(project_coordinates(lats, lons), k=1)
+    return ind[:, 0], dists[:, 0]
+
+
+def network_distance_field(network, df_pois, poi_types, max_distance_km):
+    """
+    Network distance (km) from every node to its nearest POI of the given types:
+    POIs are snapped to nodes and one multi-source Dijkstra, bounded at
+    max_distance_km, is run from all of them. Unreached nodes are inf.
+    """
+    pois_subset = df_pois[df_pois['type'].isin(poi_types)]
+    if len(pois_subset) == 0:
+        return np.full(len(network['node_ids']), np.inf)
+    sources, _ = snap_to_nodes(
+        network, pois_subset['lat'].to_numpy(dtype=float), pois_subset['lon'].to_numpy(dtype=float)
+    )
+    # search the reversed graph so one-way edges are followed from the node towards the POI
+    return dijkstra(
+        network['graph'].T.tocsr(), directed=True, indices=np.unique(sources), min_only=True, limit=max_distance_km
+    )
+
+
+def get_network_distance_field(network, df_pois, poi_types, max_distance_km):
+    """
+    Memoized network_distance_field: computed once per network, POI dataset,
+    POI types and cutoff.
+    """
+    field_key = (network['fingerprint'], fingerprint_pois(df_pois), tuple(sorted(poi_types)), max_distance_km)
+    if field_key not in _DISTANCE_FIELD_CACHE:
+        _DISTANCE_FIELD_CACHE[field_key] = network_distance_field(network, df_pois, poi_types, max_distance_km)
+    return _DISTANCE_FIELD_CACHE[field_key]
+
+
+def drop_network_distance_fields(poi_fingerprint):
+    """Forget the distance fields built from a POI dataset (e.g. after a POI refresh)."""
+    for field_key in [key for key in _DISTANCE_FIELD_CACHE if key[1] == poi_fingerprint]:
+        del _DISTANCE_FIELD_CACHE[field_key]
+
+
+def precompute_network_distance_fields(network, df_pois, poi_types_configs):
+    """
+    Warm the distance field cache for every POI type of the given configs,
+    so requests only snap hexagons and read the fields.
+    """
+    for poi_types_config in poi_types_configs:
+        for poi_type, config in poi_types_config.items():
+            get_network_distance_field(network, df_pois, config['types'], config['max_distance_km'])
+    print(f"Precomputed {len(_DISTANCE_FIELD_CACHE)} network distance fields")
+
+
+def network_decay_scores(network, df_pois, poi_types, hex_lats, hex_lons, decay_rate=1.5, max_distance_km=5, invert=False):
+    """
+    Distance-decay accessibility over the road network: the decay kernel is
+    applied to the network distance from each hexagon center (snapped to its
+    nearest node, snap distance included) to the nearest POI of the given types.
+    """
+    field = get_network_distance_field(network, df_pois, poi_types, max_distance_km)
+    nodes, snap_km = snap_to_nodes(network, hex_lats, hex_lons)
+    distance_km = field[nodes] + snap_km
+
+    scores = np.zeros(len(distance_km))
+    in_range = distance_km <= max_distance_km
+    scores[in_range] = 1 / (1 + distance_km[in_range]) ** decay_rate
+
+    if invert:
+        scores = -scores
+    return scores
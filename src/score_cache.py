@@ -0,0 +1,128 @@
+import time
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+DEFAULT_CACHE_MAX_BYTES = 256 * 1024 ** 2  # 256 MB
+DEFAULT_CACHE_TTL_SECONDS = 6 * 60 * 60     # 6 hours
+
+
+def fingerprint_config(poi_types_config):
+    """
+    Stable hash of a scoring config (decay rates, cutoffs, invert flags).
+    """
+    config_str = json.dumps(poi_types_config, sort_keys=True, default=str)
+    return hashlib.sha1(config_str.encode("utf-8")).hexdigest()
+
+
+def _frame_nbytes(value):
+    # DataFrames and sparse matrices report their real footprint; anything else counts as one byte
+    if hasattr(value, 'memory_usage'):
+        return int(value.memory_usage(deep=True).sum())
+    if hasattr(value, 'indptr'):
+        return int(value.data.nbytes + value.indices.nbytes + value.indptr.nbytes)
+    return 1
+
+
+class AccessibilityCache:
+    """
+    Thread-safe LRU cache with a memory budget and TTL, used for scored hexagon frames.
+    Entries are evicted least-recently-used first once max_bytes is exceeded,
+    and expire ttl_seconds after they were stored (None = never).
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_MAX_BYTES, ttl_seconds=DEFAULT_CACHE_TTL_SECONDS):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (value, info, nbytes, stored_at)
+        self._nbytes = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _expired(self, stored_at):
+        return self.ttl_seconds is not None and time.time() - stored_at > self.ttl_seconds
+
+    def _drop(self, key):
+        _, _, nbytes, _ = self._entries.pop(key)
+        self._nbytes -= nbytes
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if self._expired(entry[3]):
+                self._drop(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def peek(self, key):
+        """Like get, but does not touch LRU order or hit/miss counters."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry[3]):
+                return None
+            return entry[0]
+
+    def put(self, key, value, info=None):
+        nbytes = _frame_nbytes(value)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            if nbytes > self.max_bytes:
+                # would evict everything else and still not fit
+                return
+            self._entries[key] = (value, info, nbytes, time.time())
+            self._nbytes += nbytes
+            while self._nbytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def pop(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+
+    def entries(self):
+        """Snapshot of (key, value, info) for all live entries."""
+        with self._lock:
+            return [(key, value, info) for key, (value, info, _, stored_at) in self._entries.items()
+                    if not self._expired(stored_at)]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and not self._expired(entry[3])
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._nbytes,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
@@ -15,6 +15,19 @@ from sklearn.preprocessing import StandardScaler
 from sklearn.cluster import KMeans, DBSCAN
 from sklearn.preprocessing import MinMaxScaler
 import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from src.poi_index import (
+    get_poi_index, indexed_decay_scores, get_h3_poi_index, h3_decay_scores, fingerprint_pois,
+    get_binned_pois, poi_weights, project_coordinates
+)
+from src.score_cache import AccessibilityCache, fingerprint_config
+from src.fft_scoring import fft_decay_scores, DEFAULT_FFT_CELL_KM
+from src.road_network import network_decay_scores, drop_network_distance_fields
+from src.fetch_csv_data import iter_poi_chunks
+from src.h3_geometry import cell_centers, grid_disk_pairs
+from sklearn.neighbors import KDTree
+import scipy.sparse as sp
+import scipy.sparse.linalg as splinalg
 
 
 def distance_decay_score(hex_center, pois_subset, decay_rate=1.5, max_distance_km=5, invert=False):
@@ -35,94 +48,494 @@ def distance_decay_score(hex_center, pois_subset, decay_rate=1.5, max_distance_k
     
     return score
 
-import hashlib
-_ACCESSIBILITY_CACHE = {} # Cache for accessibility scores
+
+DECAY_CHUNK_ELEMENTS = 2 ** 20  # hex x POI distances evaluated per block (~8 MB of float64)
+
+
+def distance_decay_scores_batch(hex_lats, hex_lons, poi_lats, poi_lons, decay_rate=1.5,
+                                max_distance_km=5, invert=False, chunk_elements=DECAY_CHUNK_ELEMENTS,
+                                poi_weights=None):
+    """
+    Vectorized version of distance_decay_score for many hexagons at once.
+    The hex x POI distance matrix is built in row blocks of at most
+    chunk_elements cells so it stays cache/memory friendly for large POI sets.
+    Returns one score per hexagon, identical to calling distance_decay_score per hex.
+    poi_weights: optional per-POI multiplier (bin counts of aggregated POIs).
+    """
+    hex_lats = np.asarray(hex_lats, dtype=float)
+    hex_lons = np.asarray(hex_lons, dtype=float)
+    poi_lats = np.asarray(poi_lats, dtype=float)
+    poi_lons = np.asarray(poi_lons, dtype=float)
+    if poi_weights is not None:
+        poi_weights = np.asarray(poi_weights, dtype=float)
+
+    scores = np.zeros(len(hex_lats))
+    if len(hex_lats) == 0 or len(poi_lats) == 0:
+        return scores
+
+    rows_per_chunk = max(1, chunk_elements // len(poi_lats))
+    for start in range(0, len(hex_lats), rows_per_chunk):
+        stop = start + rows_per_chunk
+        lat_diff = hex_lats[start:stop, None] - poi_lats[None, :]
+        lon_diff = hex_lons[start:stop, None] - poi_lons[None, :]
+        distance_km = np.sqrt(lat_diff**2 + lon_diff**2) * 111
+
+        # POIs beyond the cutoff contribute nothing
+        contributions = 1 / (1 + distance_km) ** decay_rate
+        contributions[distance_km > max_distance_km] = 0.0
+        if poi_weights is not None:
+            contributions *= poi_weights[None, :]
+        scores[start:stop] = contributions.sum(axis=1)
+
+    if invert:
+        scores = -scores
+    return scores
+
+
+def get_poi_types_config(user_has_vehicle):
+    """
+    Default decay settings per POI type; users with a vehicle get longer cutoffs.
+    """
+    if user_has_vehicle is False:
+        poi_types_config = {
+            'restaurant':     {'types': ['restaurant'],     'decay_rate': 1.5, 'max_distance_km': 5,  'invert': False},
+            'grocery_store':  {'types': ['grocery_store'],  'decay_rate': 2,   'max_distance_km': 2,  'invert': False},
+            'school':         {'types': ['school'],         'decay_rate': 1,   'max_distance_km': 10, 'invert': False},
+            'hospital':       {'types': ['hospital'],       'decay_rate': 0.8, 'max_distance_km': 20, 'invert': False},
+            'marta_stop':     {'types': ['marta_stop'],     'decay_rate': 0.5, 'max_distance_km': 3,  'invert': False},
+            'police_station': {'types': ['police_station'], 'decay_rate': 0.5, 'max_distance_km': 10, 'invert': False},
+            'park':           {'types': ['park'],           'decay_rate': 1.0, 'max_distance_km': 3,  'invert': False},
+            'crime_incident': {'types': ['crime_incident'], 'decay_rate': 2.0, 'max_distance_km': 3,  'invert': True},
+        }
+    else:
+        poi_types_config = {
+            'restaurant':     {'types': ['restaurant'],     'decay_rate': 1.5, 'max_distance_km': 10, 'invert': False},
+            'grocery_store':  {'types': ['grocery_store'],  'decay_rate': 2,   'max_distance_km': 8,  'invert': False},
+            'school':         {'types': ['school'],         'decay_rate': 1,   'max_distance_km': 15, 'invert': False},
+            'hospital':       {'types': ['hospital'],       'decay_rate': 0.8, 'max_distance_km': 20, 'invert': False},
+            'marta_stop':     {'types': ['marta_stop'],     'decay_rate': 0.5, 'max_distance_km': 5,  'invert': False},
+            'police_station': {'types': ['police_station'], 'decay_rate': 0.5, 'max_distance_km': 10, 'invert': False},
+            'park':           {'types': ['park'],           'decay_rate': 1.0, 'max_distance_km': 5,  'invert': False},
+            'crime_incident': {'types': ['crime_incident'], 'decay_rate': 2.0, 'max_distance_km': 3,  'invert': True},
+        }
+    return poi_types_config
+
+
+def merge_poi_types_config(poi_types_config, overrides):
+    """
+    Apply request-supplied kernel overrides, e.g.
+    {'restaurant': {'decay_rate': 2.0}, 'park': {'max_distance_km': 8}},
+    on top of a base config. New POI types default to types=[name], invert=False.
+    """
+    allowed = {'types', 'decay_rate', 'max_distance_km', 'invert'}
+    merged = {poi_type: dict(config) for poi_type, config in poi_types_config.items()}
+    if not isinstance(overrides or {}, dict):
+        raise ValueError("poi_types_config must map POI types to decay parameters")
+    for poi_type, params in (overrides or {}).items():
+        if not isinstance(params, dict):
+            raise ValueError(f"Decay parameters for {poi_type} must be an object, got {params!r}")
+        unknown = set(params) - allowed
+        if unknown:
+            raise ValueError(f"Unknown decay parameters for {poi_type}: {sorted(unknown)}")
+        config = merged.get(poi_type, {'types': [poi_type], 'invert': False})
+        config = {**config, **params}
+        if 'decay_rate' not in config or 'max_distance_km' not in config:
+            raise ValueError(f"{poi_type} needs both decay_rate and max_distance_km")
+        for key in ('decay_rate', 'max_distance_km'):
+            value = config[key]
+            # bool is an int subclass, but true/false is never a meaningful rate or distance
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not np.isfinite(value):
+                raise ValueError(f"{key} for {poi_type} must be a number, got {value!r}")
+        if config['decay_rate'] < 0:
+            raise ValueError(f"decay_rate for {poi_type} must not be negative")
+        if config['max_distance_km'] <= 0:
+            raise ValueError(f"max_distance_km for {poi_type} must be positive")
+        if not isinstance(config['types'], list) or not config['types'] \
+                or not all(isinstance(type_name, str) for type_name in config['types']):
+            raise ValueError(f"types for {poi_type} must be a non-empty list of POI type names")
+        if not isinstance(config.get('invert', False), bool):
+            raise ValueError(f"invert for {poi_type} must be true or false")
+        merged[poi_type] = config
+    return merged
+
+
+_ACCESSIBILITY_CACHE = AccessibilityCache() # Cache for accessibility scores (LRU, memory budget + TTL)
+CACHE_SHARD_RESOLUTION = 5 # cached cells are stored per res-5 parent, so eviction drops one area at a time
+_SCORING_WORKER_STATE = {} # POI arrays/indexes handed to each pool worker once
+
+
+def _score_hexagons(hex_lats, hex_lons, df_pois, poi_types_config, method, poi_index=None, h3_index=None,
+                    fft_cell_km=DEFAULT_FFT_CELL_KM, road_network=None):
+    """
+    Score a block of hexagon centers for every POI type in the config.
+    Returns dict: '<poi_type>_accessibility' -> scores array.
+    """
+    scores = {}
+    for poi_type, config in poi_types_config.items():
+        if method == 'indexed':
+            type_scores = indexed_decay_scores(
+                poi_index,
+                config['types'],
+                hex_lats,
+                hex_lons,
+                decay_rate=config['decay_rate'],
+                max_distance_km=config['max_distance_km'],
+                invert=config.get('invert', False),
+            )
+        elif method == 'h3':
+            type_scores = h3_decay_scores(
+                h3_index,
+                config['types'],
+                hex_lats,
+                hex_lons,
+                decay_rate=config['decay_rate'],
+                max_distance_km=config['max_distance_km'],
+                invert=config.get('invert', False),
+            )
+        elif method == 'fft':
+            pois_subset = df_pois[df_pois['type'].isin(config['types'])]
+            type_scores = fft_decay_scores(
+                hex_lats,
+                hex_lons,
+                pois_subset['lat'].to_numpy(dtype=float),
+                pois_subset['lon'].to_numpy(dtype=float),
+                decay_rate=config['decay_rate'],
+                max_distance_km=config['max_distance_km'],
+                invert=config.get('invert', False),
+                cell_km=fft_cell_km,
+                poi_weights=poi_weights(pois_subset),
+            )
+        elif method == 'network':
+            type_scores = network_decay_scores(
+                road_network,
+                df_pois,
+                config['types'],
+                hex_lats,
+                hex_lons,
+                decay_rate=config['decay_rate'],
+                max_distance_km=config['max_distance_km'],
+                invert=config.get('invert', False),
+            )
+        elif method == 'dense':
+            pois_subset = df_pois[df_pois['type'].isin(config['types'])]
+            type_scores = distance_decay_scores_batch(
+                hex_lats,
+                hex_lons,
+                pois_subset['lat'].to_numpy(dtype=float),
+                pois_subset['lon'].to_numpy(dtype=float),
+                decay_rate=config['decay_rate'],
+                max_distance_km=config['max_distance_km'],
+                invert=config.get('invert', False),
+                poi_weights=poi_weights(pois_subset),
+            )
+        else:
+            raise ValueError(f"Unknown scoring method: {method}")
+        scores[f"{poi_type}_accessibility"] = type_scores
+    return scores
+
+
+def _init_scoring_worker(state):
+    # Runs once per worker process: POI data/indexes are sent once, not with every task
+    _SCORING_WORKER_STATE.update(state)
 
 
-def _make_hex_key(hexagons):
+def _score_hexagon_chunk(bounds):
+    start, stop = bounds
+    state = _SCORING_WORKER_STATE
+    return _score_hexagons(
+        state['hex_lats'][start:stop],
+        state['hex_lons'][start:stop],
+        state['df_pois'],
+        state['poi_types_config'],
+        state['method'],
+        state['poi_index'],
+        state['h3_index'],
+    )
+
+
+def _score_hexagons_parallel(hex_lats, hex_lons, df_pois, poi_types_config, method,
+                             poi_index=None, h3_index=None, n_workers=4, chunk_size=500):
+    """
+    Same as _score_hexagons, with hexagons split into chunks of chunk_size
+    across a process pool. Chunks are reassembled in order, so results are
+    identical to the serial path.
     """
-    Create a stable hash key from the list of hexagon IDs.
+    if len(hex_lats) == 0:
+        return _score_hexagons(hex_lats, hex_lons, df_pois, poi_types_config, method, poi_index, h3_index)
+
+    chunks = [(start, min(start + chunk_size, len(hex_lats))) for start in range(0, len(hex_lats), chunk_size)]
+    print(f"  Scoring {len(chunks)} chunks on {n_workers} worker processes...")
+
+    state = {
+        'hex_lats': hex_lats,
+        'hex_lons': hex_lons,
+        # 'count' carries the bin weights of pre-aggregated POIs
+        'df_pois': df_pois[['type', 'lat', 'lon'] + (['count'] if 'count' in df_pois.columns else [])] if method == 'dense' else None,
+        'poi_types_config': poi_types_config,
+        'method': method,
+        'poi_index': poi_index,
+        'h3_index': h3_index,
+    }
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_scoring_worker, initargs=(state,)) as executor:
+        chunk_scores = list(executor.map(_score_hexagon_chunk, chunks))
+
+    return {
+        score_column: np.concatenate([scores[score_column] for scores in chunk_scores])
+        for score_column in chunk_scores[0]
+    }
+
+
+def get_accessibility_cache():
     """
-    # Sort for order-independence
-    hex_str = "|".join(sorted(hexagons))
-    return hashlib.sha1(hex_str.encode("utf-8")).hexdigest()
+    The process-wide accessibility cache (for configuration and hit/miss/eviction stats).
+    """
+    return _ACCESSIBILITY_CACHE
 
 
 def calculate_accessibility_scores(
     hexagons,
     df_pois,
     user_has_vehicle,
-    poi_types_config=None
+    poi_types_config=None,
+    method='indexed',
+    poi_index=None,
+    h3_index_resolution=8,
+    n_workers=None,
+    chunk_size=500,
+    fft_cell_km=DEFAULT_FFT_CELL_KM,
+    poi_bin_resolution=None,
+    road_network=None
 ):
     """
     Original function with caching logic added.
-    Assumes df_pois does not change while the app is running.
+    Cache entries are keyed by the hex set, has_car, a fingerprint of df_pois
+    and a fingerprint of the scoring config, so changed data never returns stale scores.
+
+    method: 'indexed' (default) only visits POIs within max_distance_km via the
+    per-type spatial index; 'h3' gathers candidate POIs from H3 grid_disk rings
+    (bucketed at h3_index_resolution); 'dense' scores against every POI of a type;
+    'fft' is an approximate mode for metro-scale grids that convolves a
+    fft_cell_km POI raster with the decay kernel (see fft_scoring.fft_error_report);
+    'network' applies the kernel to road_network travel distance to the nearest
+    POI of each type (see road_network.load_road_network).
+    poi_bin_resolution: if set (e.g. 10 or 11), POIs are first collapsed into
+    count-weighted H3 bins at that resolution and every method scores the bins.
+    poi_index: prebuilt index from poi_index.get_poi_index (built here if None).
+    n_workers: opt-in parallel mode; > 1 splits hexagons into chunks of
+    chunk_size scored on a process pool (results identical to serial).
     """
 
+    if poi_types_config is None:
+        poi_types_config = get_poi_types_config(user_has_vehicle)
+    if poi_bin_resolution is not None:
+        df_pois = get_binned_pois(df_pois, resolution=poi_bin_resolution)
+        poi_index = None  # a prebuilt index is over raw POIs, not bins
+
     #Build cache key ----
-    hex_key = _make_hex_key(hexagons)
-    cache_key = (hex_key, bool(user_has_vehicle))
+    # cached per-cell tables per (has_car, POI data, config, parent cell): overlapping requests reuse cells
+    if method == 'network' and road_network is None:
+        raise ValueError("Network scoring requires a road network, none has been loaded")
+    if method == 'fft':
+        scoring_mode = f"fft:{fft_cell_km}"
+    elif method == 'network':
+        scoring_mode = f"network:{road_network['fingerprint']}"
+    else:
+        scoring_mode = 'exact'
+    cache_key = (bool(user_has_vehicle), fingerprint_pois(df_pois), fingerprint_config(poi_types_config), scoring_mode)
+    requested = list(hexagons)
+    unique_cells = list(dict.fromkeys(requested))
+    shard_of_cell = pd.Series(
+        [h3.cell_to_parent(hex_id, min(CACHE_SHARD_RESOLUTION, h3.get_resolution(hex_id))) for hex_id in unique_cells],
+        index=unique_cells,
+    )
+
+    cached_frames = []
+    missing = []
+    for shard, shard_cells in shard_of_cell.groupby(shard_of_cell, sort=False):
+        df_shard = _ACCESSIBILITY_CACHE.get(cache_key + (shard,))
+        if df_shard is None:
+            missing.extend(shard_cells.index)
+            continue
+        found = shard_cells.index.isin(df_shard.index)
+        cached_frames.append(df_shard.loc[shard_cells.index[found]])
+        missing.extend(shard_cells.index[~found])
+    if cached_frames and not missing:
+        print(f">> Using cached accessibility scores for all {len(requested)} hexagons")
+        return pd.concat(cached_frames).loc[requested].rename_axis('hex_id').reset_index()
+    if cached_frames:
+        print(f">> Using cached accessibility scores for {len(unique_cells) - len(missing)} hexagons")
+    #Compute scores for cells not cached ----
+    hexagons = missing
+
+    print(f"Calculating accessibility scores for {len(hexagons)} hexagons...")
+
+    hex_lats, hex_lons = cell_centers(hexagons)
+
+    df_hexagons = pd.DataFrame({'hex_id': list(hexagons), 'lat': hex_lats, 'lon': hex_lons})
+
+    if method == 'indexed' and poi_index is None:
+        poi_index = get_poi_index(df_pois)
+    h3_index = get_h3_poi_index(df_pois, resolution=h3_index_resolution) if method == 'h3' else None
+
+    # the FFT raster and network distance fields are shared by all hexagons, so they are not split across workers
+    if n_workers is not None and n_workers > 1 and method not in ('fft', 'network'):
+        scores = _score_hexagons_parallel(
+            hex_lats, hex_lons, df_pois, poi_types_config, method, poi_index, h3_index, n_workers, chunk_size
+        )
+    else:
+        scores = _score_hexagons(
+            hex_lats, hex_lons, df_pois, poi_types_config, method, poi_index, h3_index, fft_cell_km, road_network
+        )
+
+    for score_column, values in scores.items():
+        df_hexagons[score_column] = values
 
-    if cache_key in _ACCESSIBILITY_CACHE:
-        print(">> Using cached accessibility scores")
-        return _ACCESSIBILITY_CACHE[cache_key].copy()
-    #Compute scores if not cached ----
-    if poi_types_config is None:
-        if user_has_vehicle is False:
-            poi_types_config = {
-                'restaurant':     {'types': ['restaurant'],     'decay_rate': 1.5, 'max_distance_km': 5,  'invert': False},
-                'grocery_store':  {'types': ['grocery_store'],  'decay_rate': 2,   'max_distance_km': 2,  'invert': False},
-                'school':         {'types': ['school'],         'decay_rate': 1,   'max_distance_km': 10, 'invert': False},
-                'hospital':       {'types': ['hospital'],       'decay_rate': 0.8, 'max_distance_km': 20, 'invert': False},
-                'marta_stop':     {'types': ['marta_stop'],     'decay_rate': 0.5, 'max_distance_km': 3,  'invert': False},
-                'police_station': {'types': ['police_station'], 'decay_rate': 0.5, 'max_distance_km': 10, 'invert': False},
-                'park':           {'types': ['park'],           'decay_rate': 1.0, 'max_distance_km': 3,  'invert': False},
-                'crime_incident': {'types': ['crime_incident'], 'decay_rate': 2.0, 'max_distance_km': 3,  'invert': True},
-            }
-        else:
-            poi_types_config = {
-                'restaurant':     {'types': ['restaurant'],     'decay_rate': 1.5, 'max_distance_km': 10, 'invert': False},
-                'grocery_store':  {'types': ['grocery_store'],  'decay_rate': 2,   'max_distance_km': 8,  'invert': False},
-                'school':         {'types': ['school'],         'decay_rate': 1,   'max_distance_km': 15, 'invert': False},
-                'hospital':       {'types': ['hospital'],       'decay_rate': 0.8, 'max_distance_km': 20, 'invert': False},
-                'marta_stop':     {'types': ['marta_stop'],     'decay_rate': 0.5, 'max_distance_km': 5,  'invert': False},
-                'police_station': {'types': ['police_station'], 'decay_rate': 0.5, 'max_distance_km': 10, 'invert': False},
-                'park':           {'types': ['park'],           'decay_rate': 1.0, 'max_distance_km': 5,  'invert': False},
-                'crime_incident': {'types': ['crime_incident'], 'decay_rate': 2.0, 'max_distance_km': 3,  'invert': True},
-            }
-
-    hex_data = []
-    print("Calculating accessibility scores for each hexagon...")
-
-    for i, hex_id in enumerate(hexagons):
-        if i % 25 == 0:
-            print(f"  Processing hexagon {i}/{len(hexagons)}...")
-
-        hex_center = h3.cell_to_latlng(hex_id)
-        hex_scores = {'hex_id': hex_id, 'lat': hex_center[0], 'lon': hex_center[1]}
+    print(f"\nCalculated accessibility scores for {len(df_hexagons)} hexagons")
 
+    print("\nAccessibility Score Statistics:")
+    score_columns = [f"{poi_type}_accessibility" for poi_type in poi_types_config]
+    print(df_hexagons[score_columns].describe())
+    #save to cache ----
+    df_new = df_hexagons.set_index('hex_id')
+    for shard, df_shard_new in df_new.groupby(shard_of_cell.loc[df_new.index].to_numpy(), sort=False):
+        df_shard = _ACCESSIBILITY_CACHE.peek(cache_key + (shard,))  # re-read: another thread may have added cells
+        if df_shard is not None:
+            df_shard_new = pd.concat([df_shard, df_shard_new[~df_shard_new.index.isin(df_shard.index)]])
+        _ACCESSIBILITY_CACHE.put(cache_key + (shard,), df_shard_new, info=poi_types_config)
+    return pd.concat(cached_frames + [df_new]).loc[requested].rename_axis('hex_id').reset_index()
+
+def stream_accessibility_scores(hexagons, poi_path, user_has_vehicle, poi_types_config=None,
+                                chunk_rows=1_000_000, chunk_elements=DECAY_CHUNK_ELEMENTS):
+    """
+    Out-of-core variant of calculate_accessibility_scores for POI layers too
+    large to load: POIs are read from poi_path (CSV/Parquet with type, lat, lon
+    and optional count) chunk_rows at a time, and each chunk's decay contributions
+    are added to a preallocated per-hex score array.
+    Within a chunk, POIs are matched to hexagons through a KD-tree over the
+    hexagon centers and processed in blocks of at most chunk_elements in-range
+    pairs, so peak memory depends on chunk_rows, chunk_elements and the number
+    of hexagons, never on the total POI count.
+    """
+    if poi_types_config is None:
+        poi_types_config = get_poi_types_config(user_has_vehicle)
+
+    hex_lats, hex_lons = cell_centers(hexagons)
+    hex_tree = KDTree(project_coordinates(hex_lats, hex_lons)) if len(hex_lats) else None
+
+    accumulators = {poi_type: np.zeros(len(hex_lats)) for poi_type in poi_types_config}
+    n_pois = 0
+    for df_chunk in iter_poi_chunks(poi_path, chunk_rows, columns=('type', 'lat', 'lon', 'count')):
+        n_pois += len(df_chunk)
+        print(f"  Streaming POIs: {n_pois} read")
+        if hex_tree is None:
+            continue
         for poi_type, config in poi_types_config.items():
-            pois_subset = df_pois[df_pois['type'].isin(config['types'])]
-            score = distance_decay_score(
-                hex_center,
-                pois_subset,
+            pois_subset = df_chunk[df_chunk['type'].isin(config['types'])]
+            if len(pois_subset) == 0:
+                continue
+            poi_points = project_coordinates(pois_subset['lat'], pois_subset['lon'])
+            weights = poi_weights(pois_subset)
+            max_distance_km = config['max_distance_km']
+
+            # split the chunk so each block holds at most chunk_elements (POI, hex) pairs
+            pair_counts = hex_tree.query_radius(poi_points, r=max_distance_km, count_only=True)
+            block_ids = np.cumsum(pair_counts) // chunk_elements
+            block_starts = np.flatnonzero(np.diff(block_ids, prepend=-1))
+            for start, stop in zip(block_starts, np.append(block_starts[1:], len(block_ids))):
+                rows = np.arange(start, stop)
+                ind, dists = hex_tree.query_radius(poi_points[rows], r=max_distance_km, return_distance=True)
+                counts = pair_counts[rows]
+                if counts.sum() == 0:
+                    continue
+                contributions = np.repeat(weights[rows], counts) / (1 + np.concatenate(dists)) ** config['decay_rate']
+                accumulators[poi_type] += np.bincount(
+                    np.concatenate(ind), weights=contributions, minlength=len(hex_lats)
+                )
+
+    df_hexagons = pd.DataFrame({'hex_id': list(hexagons), 'lat': hex_lats, 'lon': hex_lons})
+    for poi_type, config in poi_types_config.items():
+        scores = accumulators[poi_type]
+        df_hexagons[f"{poi_type}_accessibility"] = -scores if config.get('invert', False) else scores
+
+    print(f"\nCalculated accessibility scores for {len(df_hexagons)} hexagons from {n_pois} streamed POIs")
+    return df_hexagons
+
+
+def poi_delta_scores(hex_lats, hex_lons, poi_types_config, added_pois=None, removed_pois=None):
+    """
+    Change in each *_accessibility column caused by adding/removing POIs.
+    Only hexagons within a type's max_distance_km of a changed POI get a non-zero delta.
+    Returns dict: '<poi_type>_accessibility' -> delta array.
+    """
+    deltas = {}
+    for poi_type, config in poi_types_config.items():
+        delta = np.zeros(len(hex_lats))
+        for df_changed, sign in ((added_pois, 1), (removed_pois, -1)):
+            if df_changed is None or len(df_changed) == 0:
+                continue
+            changed = df_changed[df_changed['type'].isin(config['types'])]
+            if len(changed) == 0:
+                continue
+            delta += sign * distance_decay_scores_batch(
+                hex_lats,
+                hex_lons,
+                changed['lat'].to_numpy(dtype=float),
+                changed['lon'].to_numpy(dtype=float),
                 decay_rate=config['decay_rate'],
                 max_distance_km=config['max_distance_km'],
                 invert=config.get('invert', False),
             )
-            hex_scores[f"{poi_type}_accessibility"] = score
+        deltas[f"{poi_type}_accessibility"] = delta
+    return deltas
 
-        hex_data.append(hex_scores)
 
-    df_hexagons = pd.DataFrame(hex_data)
-    print(f"\nCalculated accessibility scores for {len(df_hexagons)} hexagons")
+def apply_poi_delta(df_hexagons, poi_types_config, added_pois=None, removed_pois=None):
+    """
+    Incrementally rescore df_hexagons (output of calculate_accessibility_scores)
+    by adding/subtracting the decay contribution of changed POIs, instead of
+    recomputing every hexagon against every POI.
+    """
+    df_hexagons = df_hexagons.copy()
+    deltas = poi_delta_scores(
+        df_hexagons['lat'].to_numpy(dtype=float),
+        df_hexagons['lon'].to_numpy(dtype=float),
+        poi_types_config,
+        added_pois,
+        removed_pois,
+    )
+
+    affected = np.zeros(len(df_hexagons), dtype=bool)
+    for score_column, delta in deltas.items():
+        if score_column in df_hexagons.columns:
+            df_hexagons[score_column] += delta
+            affected |= delta != 0
+    print(f"POI delta updated {affected.sum()}/{len(df_hexagons)} hexagons")
+    return df_hexagons
+
+
+def update_cached_accessibility_scores(df_pois_before, df_pois_after, added_pois=None, removed_pois=None):
+    """
+    Apply a POI delta to every cached entry scored on df_pois_before and
+    re-key it under df_pois_after, so a POI refresh does not throw away
+    scores that were already computed. The delta is a straight-line decay sum,
+    so only 'exact' entries are patched; fft and network entries (and the
+    network distance fields) are dropped and rescored on demand.
+    """
+    poi_key_before = fingerprint_pois(df_pois_before)
+    poi_key_after = fingerprint_pois(df_pois_after)
+    drop_network_distance_fields(poi_key_before)
+
+    for cache_key, df_cached, poi_types_config in _ACCESSIBILITY_CACHE.entries():
+        has_car, poi_key, config_key, scoring_mode, shard = cache_key
+        if poi_key != poi_key_before:
+            continue
+        if scoring_mode != 'exact':
+            _ACCESSIBILITY_CACHE.pop(cache_key)
+            continue
+        df_updated = apply_poi_delta(df_cached, poi_types_config, added_pois, removed_pois)
+        _ACCESSIBILITY_CACHE.pop(cache_key)
+        _ACCESSIBILITY_CACHE.put((has_car, poi_key_after, config_key, scoring_mode, shard), df_updated, info=poi_types_config)
 
-    print("\nAccessibility Score Statistics:")
-    score_columns = [f"{poi_type}_accessibility" for poi_type in poi_types_config]
-    print(df_hexagons[score_columns].describe())
-    #save to cache
-    _ACCESSIBILITY_CACHE[cache_key] = df_hexagons
-    return df_hexagons.copy()
 
 # def calculate_accessibility_scores(hexagons, df_pois, user_has_vehicle ,poi_types_config=None):
 #     #update this fucntion to account for accesibility based on whether user has vehicle or not
@@ -215,54 +628,193 @@ def normalize_user_weights(raw_weights, method='exponential', scale_factor=2, po
 
 
 
-def smooth_scores_spatially(df_hexagons, score_columns=None, neighbor_weight=0.3):
+SMOOTHING_KERNELS = ('uniform', 'inverse_distance')
 
+_SMOOTHING_CACHE = AccessibilityCache(max_bytes=64 * 1024 ** 2, ttl_seconds=None) # (hex set, k, kernel) -> neighbor matrix
+
+
+def hex_neighbor_matrix(hexagons, k=1, kernel='uniform'):
+    """
+    Row-normalized sparse neighbor weights over a hex set: row i spreads
+    weight over the cells of rings 1..k around hexagons[i] that are in the set
+    (equal weights for 'uniform', 1/ring for 'inverse_distance').
+    Rows of hexagons without neighbors in the set are empty.
+    Cached per hex set, k and kernel.
+    """
+    if kernel not in SMOOTHING_KERNELS:
+        raise ValueError(f"Unknown smoothing kernel: {kernel} (expected one of {SMOOTHING_KERNELS})")
+    cache_key = (hashlib.sha1("|".join(hexagons).encode("utf-8")).hexdigest(), k, kernel)
+    neighbors = _SMOOTHING_CACHE.get(cache_key)
+    if neighbors is not None:
+        return neighbors
+
+    sources, ring_cells, rings = grid_disk_pairs(hexagons, k)
+    positions = pd.Index(hexagons).get_indexer(ring_cells)
+    in_set = positions >= 0
+    weights = np.ones(in_set.sum()) if kernel == 'uniform' else 1.0 / rings[in_set]
+
+    n = len(hexagons)
+    neighbors = sp.csr_matrix((weights, (sources[in_set], positions[in_set])), shape=(n, n))
+    row_sums = np.asarray(neighbors.sum(axis=1)).ravel()
+    neighbors = sp.diags(np.divide(1.0, row_sums, out=np.zeros(n), where=row_sums > 0)) @ neighbors
+    neighbors = neighbors.tocsr()
+    _SMOOTHING_CACHE.put(cache_key, neighbors)
+    return neighbors
+
+
+def smooth_scores_spatially(df_hexagons, score_columns=None, neighbor_weight=0.3, k=1, kernel='uniform', iterations=1):
+    """
+    Blend each hexagon's scores with its neighbors:
+    smoothed = (1 - neighbor_weight) * own + neighbor_weight * neighbor average,
+    where the neighbor average runs over rings 1..k (see hex_neighbor_matrix) and
+    hexagons without neighbors keep their scores. All columns are smoothed in one
+    sparse mat-mul; iterations > 1 applies the same step repeatedly through a
+    matrix power instead of a Python loop.
+    """
     if score_columns is None:
         score_columns = [col for col in df_hexagons.columns if col.endswith('_accessibility')]
-    
-    print(f"\nApplying spatial smoothing to {len(score_columns)} score columns...")
 
-    
+    print(f"\nApplying spatial smoothing to {len(score_columns)} score columns (k={k}, {kernel}, {iterations} pass(es))...")
+
     df_smoothed = df_hexagons.copy()
-    
-    # Create hex_id lookup for fast access
-    hex_to_idx = {hex_id: idx for idx, hex_id in enumerate(df_hexagons['hex_id'])}
-    
-    # For each hexagon, find neighbors and smooth scores
-    for i, row in df_hexagons.iterrows():
-        if i % 50 == 0:
-            print(f"  Smoothing hexagon {i}/{len(df_hexagons)}...")
-        
-        hex_id = row['hex_id']
-        
-        # Get neighbor hexagon IDs (k-ring with k=1 means immediate neighbors)
-        neighbor_ids = h3.grid_disk(hex_id, 1)  # Returns set including the hex itself
-        # neighbor_ids.discard(hex_id)  # Remove self
-        if hex_id in neighbor_ids:
-            neighbor_ids.remove(hex_id)  # Remove self
-        
-        # Find neighbors that exist in our dataset
-        valid_neighbors = [nid for nid in neighbor_ids if nid in hex_to_idx]
-        
-        if not valid_neighbors:
-            continue  # No neighbors, keep original scores
-        
-        # Smooth each score column
-        for col in score_columns:
-            own_score = row[col]
-            neighbor_scores = [df_hexagons.loc[hex_to_idx[nid], col] for nid in valid_neighbors]
-            avg_neighbor_score = np.mean(neighbor_scores)
-            
-            # Weighted average: keep some of own score, blend with neighbors
-            smoothed_score = (1 - neighbor_weight) * own_score + neighbor_weight * avg_neighbor_score
-            df_smoothed.at[i, col] = smoothed_score
-    
+    if len(df_hexagons) == 0 or not score_columns or iterations < 1:
+        return df_smoothed
+
+    neighbors = hex_neighbor_matrix(list(df_hexagons['hex_id']), k, kernel)
+    has_neighbors = np.diff(neighbors.indptr) > 0
+    own_weight = np.where(has_neighbors, 1 - neighbor_weight, 1.0)
+    step = (sp.diags(own_weight) + neighbor_weight * neighbors).tocsr()
+    if iterations > 1:
+        step = splinalg.matrix_power(step, iterations)
+
+    values = df_hexagons[score_columns].to_numpy(dtype=float)
+    df_smoothed[score_columns] = step @ values
+
     print("Spatial smoothing complete")
     return df_smoothed
 
 
-def apply_user_weights(df_hexagons, raw_user_weights, smooth_before_weighting=False, neighbor_weight=0.3, normalization_method='exponential'):
+NORMALIZATION_METHODS = ('minmax', 'percentile')
+
+
+def normalization_stats(values_by_column, method='minmax', percentiles=(1, 99)):
+    """
+    Fixed (low, high) bounds per score column for scaling to 0-1, computed once
+    over a reference area (e.g. the whole city) so scores stay comparable across
+    requests. 'percentile' uses the given percentiles instead of min/max, so a
+    few extreme cells do not squash everyone else.
+    values_by_column: dict column -> array of reference values.
+    """
+    if method not in NORMALIZATION_METHODS:
+        raise ValueError(f"Unknown normalization method: {method} (expected one of {NORMALIZATION_METHODS})")
+    bounds = {}
+    for col, values in values_by_column.items():
+        values = np.asarray(values, dtype=float)
+        if method == 'minmax':
+            bounds[col] = (float(np.nanmin(values)), float(np.nanmax(values)))
+        else:
+            low, high = np.nanpercentile(values, percentiles)
+            bounds[col] = (float(low), float(high))
+    return {'method': method, 'columns': bounds}
+
+
+def normalized_feature_matrix(df_hexagons, score_columns, normalization):
+    """
+    float32 (hexagons x columns) matrix of scores scaled by the fixed bounds
+    and clipped to 0-1. Columns without fixed bounds (e.g. computed on demand
+    only) fall back to min-max over these hexagons.
+    """
+    bounds = np.array([
+        normalization['columns'][col] if col in normalization['columns']
+        else (df_hexagons[col].min(), df_hexagons[col].max())
+        for col in score_columns
+    ], dtype=np.float32).reshape(-1, 2)
+    low, high = bounds[:, 0], bounds[:, 1]
+    span = np.where(high > low, high - low, 1).astype(np.float32)
+    features = (df_hexagons[score_columns].to_numpy(dtype=np.float32) - low) / span
+    return np.clip(features, 0, 1)
+
+
+def score_user_profiles(df_hexagons, profiles, normalization=None, normalization_method='exponential'):
+    """
+    user_match_score of many weight profiles over the same hexagons in one
+    (hexagons x columns) feature matrix x (columns x profiles) weight matrix product.
+    profiles: dict name -> raw user weights (as passed to apply_user_weights).
+    normalization: fixed bounds from normalization_stats; defaults to min-max
+    over df_hexagons, matching apply_user_weights without bounds.
+    Returns DataFrame (index aligned with df_hexagons, one column per profile).
+    """
+    weights_by_profile = {
+        name: normalize_user_weights(raw_weights, method=normalization_method)
+        for name, raw_weights in profiles.items()
+    }
+    poi_types = list(dict.fromkeys(poi_type for weights in weights_by_profile.values() for poi_type in weights))
+    score_columns = [f"{poi_type}_accessibility" for poi_type in poi_types]
+    for poi_type, score_column in zip(poi_types, score_columns):
+        if score_column not in df_hexagons.columns:
+            raise ValueError(f"Accessibility score for {poi_type} not found in DataFrame")
+
+    if normalization is None:
+        normalization = normalization_stats({col: df_hexagons[col] for col in score_columns})
+    features = normalized_feature_matrix(df_hexagons, score_columns, normalization)
 
+    weight_matrix = np.zeros((len(poi_types), len(weights_by_profile)), dtype=np.float32)
+    for j, weights in enumerate(weights_by_profile.values()):
+        for poi_type, weight in weights.items():
+            weight_matrix[poi_types.index(poi_type), j] = weight
+
+    print(f"Scored {len(weights_by_profile)} profiles over {len(df_hexagons)} hexagons")
+    return pd.DataFrame(features @ weight_matrix, index=df_hexagons.index, columns=list(weights_by_profile))
+
+
+def rank_user_profiles(df_hexagons, profile_scores, top_n=None):
+    """
+    Per-profile ranking of hexagons by match score (best first), as
+    dict name -> list of {'rank', 'hex_id', 'user_match_score'}; top_n limits each list.
+    """
+    hex_ids = df_hexagons['hex_id'].to_numpy()
+    rankings = {}
+    for name in profile_scores.columns:
+        scores = profile_scores[name].to_numpy()
+        order = np.argsort(-scores, kind='stable')[:top_n]
+        rankings[name] = [
+            {'rank': rank + 1, 'hex_id': hex_ids[i], 'user_match_score': float(scores[i])}
+            for rank, i in enumerate(order)
+        ]
+    return rankings
+
+
+def top_k_positions(scores, k, offset=0):
+    """
+    Row positions of ranks offset .. offset + k - 1 by descending score, found
+    with a partial selection (argpartition) instead of a full sort.
+    NaN scores rank last; tied scores rank by row position, so pages of the
+    same scores never overlap or skip rows.
+    """
+    if offset < 0:
+        raise ValueError(f"offset must be non-negative, got {offset}")
+    scores = np.where(np.isnan(scores), -np.inf, np.asarray(scores, dtype=float))
+    stop = min(offset + k, len(scores))
+    if offset >= stop:
+        return np.zeros(0, dtype=int)
+    if stop < len(scores):
+        # every row tied with the stop-th best score is a candidate, not an arbitrary subset of them
+        kth_score = -np.partition(-scores, stop - 1)[stop - 1]
+        best = np.flatnonzero(scores >= kth_score)
+    else:
+        best = np.arange(len(scores))
+    best = best[np.lexsort((best, -scores[best]))]
+    return best[offset:stop]
+
+
+def apply_user_weights(df_hexagons, raw_user_weights, smooth_before_weighting=False, neighbor_weight=0.3, normalization_method='exponential',
+                       normalization=None):
+    """
+    Add per-type *_norm columns and the weighted user_match_score.
+    normalization: fixed bounds from normalization_stats; when given, scores are
+    scaled by them and user_match_score is one float32 matrix-vector product.
+    Otherwise each column is min-max scaled over this request's hexagons.
+    """
     
     print(f"Applying user preferences: {raw_user_weights}")
     # print(f"Sum of weights: {sum(user_weights.values()):.2f} (should be 1.0)")
@@ -277,6 +829,22 @@ def apply_user_weights(df_hexagons, raw_user_weights, smooth_before_weighting=Fa
         score_columns = [f"{poi_type}_accessibility" for poi_type in user_weights.keys()]
         df_hexagons = smooth_scores_spatially(df_hexagons, score_columns, neighbor_weight)
     
+    if normalization is not None:
+        score_columns = [f"{poi_type}_accessibility" for poi_type in user_weights]
+        for poi_type, score_column in zip(user_weights, score_columns):
+            if score_column not in df_hexagons.columns:
+                raise ValueError(f"Accessibility score for {poi_type} not found in DataFrame")
+        features = normalized_feature_matrix(df_hexagons, score_columns, normalization)
+        weights = np.array(list(user_weights.values()), dtype=np.float32)
+        for i, poi_type in enumerate(user_weights):
+            df_hexagons[f"{poi_type}_norm"] = features[:, i]
+        df_hexagons['user_match_score'] = features @ weights
+        df_hexagons.attrs['user_weights'] = user_weights
+
+        print(f"\nUser Match Score Statistics ({normalization['method']} citywide normalization):")
+        print(df_hexagons['user_match_score'].describe())
+        return df_hexagons
+
     # Normalize accessibility scores to 0-1 range
     scaler = MinMaxScaler()
     
@@ -294,8 +862,49 @@ def apply_user_weights(df_hexagons, raw_user_weights, smooth_before_weighting=Fa
         norm_column = f"{poi_type}_norm"
         if norm_column in df_hexagons.columns:
             df_hexagons['user_match_score'] += df_hexagons[norm_column] * weight
+    df_hexagons.attrs['user_weights'] = user_weights
     
     print(f"\nUser Match Score Statistics:")
     print(df_hexagons['user_match_score'].describe())
     
-    return df_hexagons
\ No newline at end of file
+    return df_hexagons
+
+
+def explain_user_scores(df_scored, hex_ids, user_weights=None):
+    """
+    Per-feature breakdown of user_match_score (weight x norm) for the given
+    hexagons of a frame scored by apply_user_weights. user_weights are the
+    normalized weights; defaults to the ones apply_user_weights recorded.
+    Returns (explanations, missing_hex_ids).
+    """
+    if user_weights is None:
+        user_weights = df_scored.attrs.get('user_weights')
+        if user_weights is None:
+            raise ValueError("Scored frame carries no user weights; pass user_weights explicitly")
+
+    positions = pd.Index(df_scored['hex_id']).get_indexer(list(hex_ids))
+    missing = [hex_id for hex_id, position in zip(hex_ids, positions) if position < 0]
+    df_rows = df_scored.iloc[positions[positions >= 0]]
+
+    poi_types = list(user_weights)
+    weights = np.array([user_weights[poi_type] for poi_type in poi_types])
+    norms = df_rows[[f"{poi_type}_norm" for poi_type in poi_types]].to_numpy(dtype=float)
+    accessibility = df_rows[[f"{poi_type}_accessibility" for poi_type in poi_types]].to_numpy(dtype=float)
+    contributions = norms * weights
+
+    explanations = []
+    for row, hex_id in enumerate(df_rows['hex_id']):
+        explanations.append({
+            'hex_id': hex_id,
+            'user_match_score': float(df_rows['user_match_score'].iat[row]),
+            'features': {
+                poi_type: {
+                    'weight': float(weights[i]),
+                    'norm': float(norms[row, i]),
+                    'accessibility': float(accessibility[row, i]),
+                    'contribution': float(contributions[row, i]),
+                }
+                for i, poi_type in enumerate(poi_types)
+            },
+        })
+    return explanations, missing
@@ -12,6 +12,7 @@ from folium.plugins import HeatMap
 from sklearn.preprocessing import StandardScaler
 from sklearn.cluster import KMeans, DBSCAN
 from sklearn.preprocessing import MinMaxScaler
+from src.quantile_sketch import KLLSketch
 
 def classify_suitability(score, thresholds):
     # if score >= high_threshold:
@@ -28,7 +29,36 @@ def classify_suitability(score, thresholds):
     
 
 
-def cluster_based_on_score(df_hexagons, score_column='user_match_score', n_tiers=3, suitability_labels=None):
+def tier_scores(scores, thresholds):
+    """
+    Vectorized classify_suitability: the tier of a score is the number of
+    (descending) thresholds strictly above it, found with one searchsorted
+    against the ascending thresholds. NaN scores fall in the last tier.
+    """
+    scores = np.asarray(scores, dtype=float)
+    ascending = np.asarray(thresholds, dtype=float)[::-1]
+    tiers = len(ascending) - np.searchsorted(ascending, scores, side='right')
+    tiers[np.isnan(scores)] = len(ascending)
+    return tiers.astype(np.int64)
+
+
+def score_sketch(score_chunks, k=200, seed=None):
+    """
+    KLLSketch over a stream of score arrays (e.g. chunks or shards of a
+    metro-scale grid), for tier thresholds without materializing the column.
+    """
+    sketch = KLLSketch(k=k, seed=seed)
+    for scores in score_chunks:
+        sketch.update(scores)
+    return sketch
+
+
+def cluster_based_on_score(df_hexagons, score_column='user_match_score', n_tiers=3, suitability_labels=None, sketch=None):
+    """
+    Percentile tiers of score_column. Thresholds come from the frame's exact
+    quantiles, or from sketch (a KLLSketch of the full, possibly sharded,
+    score distribution) so each shard is tiered against the same cut points.
+    """
 
     df_hexagons = df_hexagons.copy()
 
@@ -40,7 +70,10 @@ def cluster_based_on_score(df_hexagons, score_column='user_match_score', n_tiers
         }
     
     percentiles = [(1 - i/n_tiers) for i in range(1, n_tiers)]
-    thresholds = [df_hexagons[score_column].quantile(p) for p in percentiles]
+    if sketch is not None:
+        thresholds = list(sketch.quantiles(percentiles))
+    else:
+        thresholds = list(df_hexagons[score_column].quantile(percentiles))
 
 
     print(f"Classifying into {n_tiers} tiers:")
@@ -48,13 +81,7 @@ def cluster_based_on_score(df_hexagons, score_column='user_match_score', n_tiers
         print(f"  Tier {i} threshold (top {p*100:.1f}%): {t:.3f}")
     
 
-    df_hexagons['suitability'] = df_hexagons[score_column].apply(
-        lambda x: classify_suitability(x, thresholds)
-    )
-    
-    # Generate labels if not provided
-    if suitability_labels is None:
-        suitability_labels = {i: f'Tier {i+1}' for i in range(n_tiers)}
+    df_hexagons['suitability'] = tier_scores(df_hexagons[score_column].to_numpy(dtype=float), thresholds)
     
     # Map numerical tiers to readable labels
     df_hexagons['suitability_label'] = df_hexagons['suitability'].map(suitability_labels)
@@ -68,23 +95,26 @@ def cluster_based_on_score(df_hexagons, score_column='user_match_score', n_tiers
     print("SUITABILITY TIER CHARACTERISTICS")
     print("="*60)
     
+    # Show top 3 accessibility metrics only (to avoid clutter)
     accessibility_columns = [col for col in df_hexagons.columns 
-                           if col.endswith('_accessibility')]
+                           if col.endswith('_accessibility')][:3]
+    
+    # all per-tier statistics in one grouped aggregation
+    tier_stats = df_hexagons.groupby('suitability').agg(
+        n_hexagons=(score_column, 'size'),
+        score_min=(score_column, 'min'),
+        score_max=(score_column, 'max'),
+        **{col: (col, 'mean') for col in accessibility_columns},
+    )
     
     for tier in sorted(suitability_labels.keys()):
-        tier_data = df_hexagons[df_hexagons['suitability'] == tier]
-        if len(tier_data) == 0:
+        if tier not in tier_stats.index:
             continue
+        stats = tier_stats.loc[tier]
         label = suitability_labels[tier]
-        print(f"\n{label} ({len(tier_data)} hexagons):")
-        print(f"  Match Score Range: {tier_data[score_column].min():.3f} - {tier_data[score_column].max():.3f}")
-        
-        # Show top 3 accessibility metrics only (to avoid clutter)
-        if len(accessibility_columns) <= 3:
-            for col in accessibility_columns:
-                print(f"  Avg {col.replace('_accessibility', '')}: {tier_data[col].mean():.3f}")
-        else:
-            for col in accessibility_columns[:3]:
-                print(f"  Avg {col.replace('_accessibility', '')}: {tier_data[col].mean():.3f}")
+        print(f"\n{label} ({int(stats['n_hexagons'])} hexagons):")
+        print(f"  Match Score Range: {stats['score_min']:.3f} - {stats['score_max']:.3f}")
+        for col in accessibility_columns:
+            print(f"  Avg {col.replace('_accessibility', '')}: {stats[col]:.3f}")
     
     return df_hexagons
@@ -0,0 +1,450 @@
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+import h3
+from sklearn.neighbors import KDTree
+from src.poi_index import project_coordinates, fingerprint_pois, poi_weights
+from src.accessibility_store import DEFAULT_STORE_DIR, TRANSIT_COLUMN_PREFIX, lookup_accessibility_scores
+from src.h3_geometry import cell_centers
+
+
+# Transit accessibility from a local GTFS feed (stops.txt, trips.txt, stop_times.txt):
+# for each hexagon, RAPTOR finds the earliest arrival at every stop from the stops
+# within walking distance, and the score is the number of opportunities (POIs)
+# reachable by walk + transit + walk within TRANSIT_TRAVEL_TIME_MIN, averaged
+# over departures sampled in each departure window. transit_accessibility is the
+# mean over all departures, transit_accessibility_<window> the mean per window.
+
+DEFAULT_GTFS_DIR = "data/input_data/marta_gtfs"
+
+WALK_SPEED_KMH = 4.8
+MAX_WALK_KM = 0.8             # access, egress and transfer walks
+TRANSIT_TRAVEL_TIME_MIN = 45
+TRANSIT_MAX_ROUNDS = 4        # up to 3 transfers
+DEFAULT_DEPARTURE_WINDOWS = {
+    'am_peak': ('07:00:00', '09:00:00'),
+    'midday': ('11:00:00', '13:00:00'),
+    'pm_peak': ('16:30:00', '18:30:00'),
+}
+DEPARTURE_STEP_MIN = 30       # departures sampled every 30 minutes inside each window
+REPRESENTATIVE_WEEKDAY = 'wednesday'  # service day simulated when the feed has a calendar
+MAX_ON_DEMAND_TRANSIT_HEXAGONS = 200  # RAPTOR runs per hexagon x departure, so requests may only route a few cells
+
+_TRANSIT_SCORE_CACHE = {} # (feed, POI fingerprint, windows) -> {hex_id: scores row}
+
+
+def gtfs_time_to_seconds(times):
+    # GTFS times are HH:MM:SS and may run past 24:00:00 for after-midnight trips
+    parts = pd.Series(times).str.strip().str.split(':', expand=True).astype(int)
+    return (parts[0] * 3600 + parts[1] * 60 + parts[2]).to_numpy()
+
+
+def _walk_seconds(distance_km):
+    return distance_km / WALK_SPEED_KMH * 3600
+
+
+def _interpolate_untimed_stops(df_stop_times):
+    """
+    GTFS only requires times at timepoints: untimed intermediate stops get
+    arrival = departure interpolated linearly between the timed stops around
+    them, by shape_dist_traveled when the feed has it, else by stop order.
+    Trips that cannot be bracketed (untimed first/last stop) are dropped.
+    Expects rows sorted by trip and stop_sequence; adds 'arrival' and 'departure' seconds.
+    """
+    df_stop_times = df_stop_times.copy()
+    times = {}
+    for col in ('arrival_time', 'departure_time'):
+        seconds = pd.Series(np.nan, index=df_stop_times.index)
+        timed = df_stop_times[col].notna()
+        seconds[timed] = gtfs_time_to_seconds(df_stop_times.loc[timed, col])
+        times[col] = seconds
+    arrival = times['arrival_time'].fillna(times['departure_time'])
+    departure = times['departure_time'].fillna(times['arrival_time'])
+
+    trips = df_stop_times['trip_id']
+    if 'shape_dist_traveled' in df_stop_times and df_stop_times['shape_dist_traveled'].notna().all():
+        position = df_stop_times['shape_dist_traveled'].astype(float)
+    else:
+        position = df_stop_times.groupby('trip_id', sort=False).cumcount().astype(float)
+    timed = arrival.notna()
+    prev_time = departure.where(timed).groupby(trips).ffill()
+    prev_position = position.where(timed).groupby(trips).ffill()
+    next_time = arrival.where(timed).groupby(trips).bfill()
+    next_position = position.where(timed).groupby(trips).bfill()
+    span = (next_position - prev_position).where(lambda x: x > 0)
+    interpolated = prev_time + (next_time - prev_time) * ((position - prev_position) / span).fillna(0)
+
+    df_stop_times['arrival'] = arrival.fillna(interpolated)
+    df_stop_times['departure'] = departure.fillna(interpolated)
+    untimed = int((~timed).sum())
+    unbracketed = df_stop_times.loc[df_stop_times['arrival'].isna(), 'trip_id'].unique()
+    df_stop_times = df_stop_times[~df_stop_times['trip_id'].isin(unbracketed)]
+    if untimed:
+        print(f"Interpolated times of {untimed} untimed stop events, dropped {len(unbracketed)} trips without timed endpoints")
+    df_stop_times['arrival'] = np.rint(df_stop_times['arrival'].to_numpy()).astype(int)
+    df_stop_times['departure'] = np.rint(df_stop_times['departure'].to_numpy()).astype(int)
+    return df_stop_times
+
+
+def representative_service_ids(gtfs_dir=DEFAULT_GTFS_DIR, weekday=REPRESENTATIVE_WEEKDAY):
+    """
+    Services running on one representative day, so weekday, weekend and holiday
+    trips are not merged into one simulated day: among all dates of the feed
+    falling on weekday, the one with the most trips (calendar.txt ranges plus
+    calendar_dates.txt additions/removals).
+    Returns None (all trips) if the feed has no calendar files.
+    """
+    calendar_path = os.path.join(gtfs_dir, "calendar.txt")
+    calendar_dates_path = os.path.join(gtfs_dir, "calendar_dates.txt")
+    df_calendar = pd.read_csv(calendar_path, dtype={'service_id': str, 'start_date': str, 'end_date': str}) \
+        if os.path.exists(calendar_path) else None
+    df_dates = pd.read_csv(calendar_dates_path, dtype={'service_id': str, 'date': str}) \
+        if os.path.exists(calendar_dates_path) else None
+    if df_calendar is None and df_dates is None:
+        print(f"No calendar in GTFS feed at {gtfs_dir}, using all trips")
+        return None
+
+    bounds = []
+    if df_calendar is not None:
+        bounds += [pd.to_datetime(df_calendar['start_date']).min(), pd.to_datetime(df_calendar['end_date']).max()]
+    if df_dates is not None:
+        bounds += [pd.to_datetime(df_dates['date']).min(), pd.to_datetime(df_dates['date']).max()]
+    candidates = [date for date in pd.date_range(min(bounds), max(bounds)) if date.day_name().lower() == weekday]
+
+    df_trips = pd.read_csv(os.path.join(gtfs_dir, "trips.txt"), dtype={'service_id': str}, usecols=['service_id'])
+    trips_per_service = df_trips['service_id'].value_counts()
+
+    best_services, best_trips = None, -1
+    for date in candidates:
+        services = set()
+        if df_calendar is not None:
+            running = (df_calendar[weekday] == 1) \
+                & (pd.to_datetime(df_calendar['start_date']) <= date) & (pd.to_datetime(df_calendar['end_date']) >= date)
+            services = set(df_calendar.loc[running, 'service_id'])
+        if df_dates is not None:
+            on_date = df_dates[df_dates['date'] == date.strftime('%Y%m%d')]
+            services |= set(on_date.loc[on_date['exception_type'] == 1, 'service_id'])
+            services -= set(on_date.loc[on_date['exception_type'] == 2, 'service_id'])
+        n_trips = int(trips_per_service.reindex(list(services)).fillna(0).sum())
+        if n_trips > best_trips:
+            best_services, best_trips = sorted(services), n_trips
+            best_date = date
+    if best_services is None:
+        print(f"No {weekday} service in GTFS feed at {gtfs_dir}, using all trips")
+        return None
+    print(f"Representative {weekday}: {best_date:%Y-%m-%d} with services {best_services} ({best_trips} trips)")
+    return best_services
+
+
+def load_transit_timetable(gtfs_dir=DEFAULT_GTFS_DIR, service_ids=None):
+    """
+    Read a GTFS feed into RAPTOR's route-pattern layout. Trips with the same
+    stop sequence form one pattern, with (trips x stops) arrival/departure
+    matrices sorted by departure time. Footpaths connect stops within MAX_WALK_KM.
+    service_ids: keep only trips of these services (e.g. the weekday calendar).
+    Returns None if no feed is present.
+    """
+    required = ["stops.txt", "trips.txt", "stop_times.txt"]
+    if not all(os.path.exists(os.path.join(gtfs_dir, name)) for name in required):
+        print(f"No GTFS feed found at {gtfs_dir}")
+        return None
+
+    df_stops = pd.read_csv(os.path.join(gtfs_dir, "stops.txt"), dtype={'stop_id': str})
+    df_trips = pd.read_csv(os.path.join(gtfs_dir, "trips.txt"), dtype={'trip_id': str, 'service_id': str})
+    df_stop_times = pd.read_csv(
+        os.path.join(gtfs_dir, "stop_times.txt"),
+        dtype={'trip_id': str, 'stop_id': str},
+        usecols=lambda col: col in ('trip_id', 'arrival_time', 'departure_time', 'stop_id', 'stop_sequence',
+                                    'shape_dist_traveled'),
+    )
+    if service_ids is not None:
+        df_trips = df_trips[df_trips['service_id'].isin(service_ids)]
+        df_stop_times = df_stop_times[df_stop_times['trip_id'].isin(df_trips['trip_id'])]
+
+    stop_position = pd.Series(np.arange(len(df_stops)), index=df_stops['stop_id'])
+    df_stop_times = df_stop_times.sort_values(['trip_id', 'stop_sequence'])
+    df_stop_times = _interpolate_untimed_stops(df_stop_times)
+    df_stop_times['stop'] = stop_position.loc[df_stop_times['stop_id']].to_numpy()
+
+    # group trips by their stop sequence into patterns
+    trip_stops = df_stop_times.groupby('trip_id', sort=False)['stop'].agg(tuple)
+    pattern_of_trip = pd.Series(pd.factorize(trip_stops)[0], index=trip_stops.index)
+    df_stop_times['pattern'] = pattern_of_trip.loc[df_stop_times['trip_id']].to_numpy()
+
+    patterns = []
+    stop_patterns = [[] for _ in range(len(df_stops))]
+    for _, df_pattern in df_stop_times.groupby('pattern', sort=True):
+        stop_sequence = trip_stops.loc[df_pattern['trip_id'].iloc[0]]
+        if len(stop_sequence) < 2:
+            continue
+        n_trips = len(df_pattern) // len(stop_sequence)
+        # rows are grouped by trip and ordered by stop_sequence, so each trip is one matrix row
+        arrivals = df_pattern['arrival'].to_numpy().reshape(n_trips, len(stop_sequence))
+        departures = df_pattern['departure'].to_numpy().reshape(n_trips, len(stop_sequence))
+        order = np.argsort(departures[:, 0], kind='stable')
+        pattern_id = len(patterns)
+        patterns.append({
+            'stops': np.array(stop_sequence),
+            'arrivals': arrivals[order],
+            'departures': departures[order],
+        })
+        for position, stop in enumerate(stop_sequence):
+            stop_patterns[stop].append((pattern_id, position))
+
+    stop_lats = df_stops['stop_lat'].to_numpy(dtype=float)
+    stop_lons = df_stops['stop_lon'].to_numpy(dtype=float)
+    stop_tree = KDTree(project_coordinates(stop_lats, stop_lons))
+    neighbors, dists = stop_tree.query_radius(
+        project_coordinates(stop_lats, stop_lons), r=MAX_WALK_KM, return_distance=True
+    )
+    footpaths = [
+        [(int(other), _walk_seconds(d)) for other, d in zip(ind, dist) if other != stop]
+        for stop, (ind, dist) in enumerate(zip(neighbors, dists))
+    ]
+
+    feed_hash = hashlib.sha1(
+        pd.util.hash_pandas_object(df_stop_times[['trip_id', 'stop', 'arrival', 'departure']], index=False)
+        .to_numpy().tobytes()
+    ).hexdigest()
+    timetable = {
+        'stop_ids': df_stops['stop_id'].to_numpy(),
+        'stop_lat': stop_lats,
+        'stop_lon': stop_lons,
+        'stop_tree': stop_tree,
+        'patterns': patterns,
+        'stop_patterns': stop_patterns,
+        'footpaths': footpaths,
+        'fingerprint': feed_hash,
+    }
+    print(f"Loaded GTFS feed: {len(df_stops)} stops, {len(trip_stops)} trips in {len(patterns)} patterns")
+    return timetable
+
+
+def raptor_earliest_arrivals(timetable, access_stops, access_seconds, departure_time,
+                             max_rounds=TRANSIT_MAX_ROUNDS, horizon=None):
+    """
+    Round-based public transit routing (RAPTOR). Starting from the access stops,
+    reached at departure_time + access walk, each round rides every pattern
+    serving a stop improved in the previous round, then relaxes footpaths.
+    Round k allows k - 1 transfers. Returns earliest arrival (seconds) per stop,
+    inf where the stop is not reached before horizon.
+    """
+    n_stops = len(timetable['stop_ids'])
+    horizon = np.inf if horizon is None else horizon
+    best = np.full(n_stops, np.inf)
+    best[access_stops] = departure_time + np.asarray(access_seconds, dtype=float)
+    marked = set(int(stop) for stop in access_stops)
+
+    for _ in range(max_rounds):
+        previous = best.copy()
+
+        # earliest marked position on each pattern serving a marked stop
+        queue = {}
+        for stop in marked:
+            for pattern_id, position in timetable['stop_patterns'][stop]:
+                if position < queue.get(pattern_id, np.inf):
+                    queue[pattern_id] = position
+
+        improved = set()
+        for pattern_id, start in queue.items():
+            pattern = timetable['patterns'][pattern_id]
+            stops = pattern['stops']
+            departures = pattern['departures']
+            arrivals = pattern['arrivals']
+            trip = None
+            for position in range(start, len(stops)):
+                stop = stops[position]
+                if trip is not None:
+                    arrival = arrivals[trip, position]
+                    if arrival < best[stop] and arrival <= horizon:
+                        best[stop] = arrival
+                        improved.add(int(stop))
+                # board an earlier trip if this stop was reached in time for it
+                if previous[stop] < np.inf and (trip is None or previous[stop] <= departures[trip, position]):
+                    candidate = np.searchsorted(departures[:, position], previous[stop])
+                    if candidate < len(departures) and (trip is None or candidate < trip):
+                        trip = candidate
+
+        for stop in list(improved):
+            for other, walk_seconds in timetable['footpaths'][stop]:
+                arrival = best[stop] + walk_seconds
+                if arrival < best[other] and arrival <= horizon:
+                    best[other] = arrival
+                    improved.add(other)
+
+        marked = improved
+        if not marked:
+            break
+
+    return best
+
+
+def departure_times(departure_windows=DEFAULT_DEPARTURE_WINDOWS, step_min=DEPARTURE_STEP_MIN):
+    """
+    Departure times (seconds after midnight) sampled every step_min inside each window.
+    """
+    times = []
+    for start, end in departure_windows.values():
+        start_s, end_s = gtfs_time_to_seconds([start, end])
+        times.extend(range(start_s, end_s + 1, step_min * 60))
+    return np.array(times)
+
+
+def _expand_rows(indptr, rows):
+    # positions of all entries of the given CSR rows
+    lengths = indptr[rows + 1] - indptr[rows]
+    offsets = np.repeat(indptr[rows] - np.cumsum(lengths) + lengths, lengths)
+    return np.repeat(rows, lengths), offsets + np.arange(lengths.sum())
+
+
+def transit_columns(departure_windows=DEFAULT_DEPARTURE_WINDOWS):
+    """Overall column followed by one column per departure window."""
+    return [TRANSIT_COLUMN_PREFIX] + [f"{TRANSIT_COLUMN_PREFIX}_{window}" for window in departure_windows]
+
+
+def transit_accessibility_scores(timetable, df_pois, hex_lats, hex_lons,
+                                 departure_windows=DEFAULT_DEPARTURE_WINDOWS,
+                                 travel_time_min=TRANSIT_TRAVEL_TIME_MIN):
+    """
+    Opportunities reachable from each hexagon center within travel_time_min by
+    walking and transit, averaged over the sampled departures.
+    Opportunities are all POIs except transit stops themselves (count-weighted if binned).
+    Returns (n_hexagons, 1 + n_windows) array in transit_columns order: the mean
+    over all departures, then the mean over each window's departures.
+    """
+    df_opportunities = df_pois[df_pois['type'] != 'marta_stop']
+    weights = poi_weights(df_opportunities)
+    poi_tree = KDTree(project_coordinates(df_opportunities['lat'], df_opportunities['lon']))
+
+    # egress: POIs within walking distance of every stop, as CSR rows
+    egress_pois, egress_km = poi_tree.query_radius(
+        project_coordinates(timetable['stop_lat'], timetable['stop_lon']), r=MAX_WALK_KM, return_distance=True
+    )
+    egress_indptr = np.concatenate([[0], np.cumsum([len(ind) for ind in egress_pois])])
+    egress_pois = np.concatenate(egress_pois).astype(int)
+    egress_seconds = _walk_seconds(np.concatenate(egress_km))
+
+    hex_points = project_coordinates(hex_lats, hex_lons)
+    access_stops, access_km = timetable['stop_tree'].query_radius(hex_points, r=MAX_WALK_KM, return_distance=True)
+    direct_pois = poi_tree.query_radius(hex_points, r=MAX_WALK_KM)
+
+    window_departures = [departure_times({window: bounds}) for window, bounds in departure_windows.items()]
+    budget = travel_time_min * 60
+    # per hexagon: sum of reachable opportunities over each window's departures
+    window_totals = np.zeros((len(hex_points), len(window_departures)))
+
+    for i in range(len(hex_points)):
+        if len(access_stops[i]) == 0:
+            # no stop within walking distance: only what can be walked to
+            window_totals[i] = weights[direct_pois[i]].sum() * np.array([len(deps) for deps in window_departures])
+            continue
+
+        for w, departures in enumerate(window_departures):
+            for departure in departures:
+                arrivals = raptor_earliest_arrivals(
+                    timetable, access_stops[i], _walk_seconds(access_km[i]), departure, horizon=departure + budget
+                )
+                reached = np.flatnonzero(arrivals <= departure + budget)
+                stop_of_entry, entries = _expand_rows(egress_indptr, reached)
+                in_time = arrivals[stop_of_entry] + egress_seconds[entries] <= departure + budget
+                reachable = np.union1d(egress_pois[entries[in_time]], direct_pois[i])
+                window_totals[i, w] += weights[reachable].sum()
+
+    n_departures = np.array([len(deps) for deps in window_departures])
+    overall = window_totals.sum(axis=1) / n_departures.sum()
+    return np.column_stack([overall, window_totals / n_departures])
+
+
+def get_transit_accessibility_scores(timetable, df_pois, hexagons, departure_windows=DEFAULT_DEPARTURE_WINDOWS,
+                                     travel_time_min=TRANSIT_TRAVEL_TIME_MIN):
+    """
+    transit_accessibility_scores for H3 cells, memoized per cell so each hexagon
+    is routed once per feed, POI dataset and departure windows.
+    Returns DataFrame with transit_columns, aligned with hexagons.
+    """
+    cache_key = (
+        timetable['fingerprint'], fingerprint_pois(df_pois),
+        json.dumps(departure_windows, sort_keys=True), travel_time_min,
+    )
+    cell_scores = _TRANSIT_SCORE_CACHE.setdefault(cache_key, {})
+    missing = [hex_id for hex_id in dict.fromkeys(hexagons) if hex_id not in cell_scores]
+    if missing:
+        print(f"Routing transit accessibility for {len(missing)} hexagons...")
+        hex_lats, hex_lons = cell_centers(missing)
+        scores = transit_accessibility_scores(
+            timetable, df_pois, hex_lats, hex_lons, departure_windows, travel_time_min,
+        )
+        cell_scores.update(zip(missing, scores))
+    columns = transit_columns(departure_windows)
+    return pd.DataFrame(
+        np.array([cell_scores[hex_id] for hex_id in hexagons], dtype=float).reshape(-1, len(columns)),
+        columns=columns,
+    )
+
+
+def add_transit_accessibility(df_hexagons, timetable, df_pois, store=None,
+                              max_on_demand=MAX_ON_DEMAND_TRANSIT_HEXAGONS):
+    """
+    Fill the transit columns for rows that do not have them yet. Cells finer
+    than the store take their stored parent's scores; only what is left is
+    routed, and at most max_on_demand cells per request. Beyond that the
+    transit columns are dropped for the request (other scores are unaffected).
+    """
+    df_hexagons = df_hexagons.copy()
+    columns = transit_columns()
+    for col in columns:
+        if col not in df_hexagons.columns:
+            df_hexagons[col] = np.nan
+    missing = df_hexagons[TRANSIT_COLUMN_PREFIX].isna().to_numpy()
+
+    store_columns = store['columns']['no_car'] if store is not None else {}
+    if missing.any() and all(col in store_columns for col in columns):
+        store_resolution = store['meta']['resolution']
+        finer = missing & np.array([h3.get_resolution(hex_id) > store_resolution for hex_id in df_hexagons['hex_id']])
+        if finer.any():
+            parents = [h3.cell_to_parent(hex_id, store_resolution) for hex_id in df_hexagons.loc[finer, 'hex_id']]
+            df_parents, _ = lookup_accessibility_scores(store, list(dict.fromkeys(parents)), has_car=False)
+            if len(df_parents):
+                parent_scores = df_parents.set_index('hex_id')[columns].reindex(parents)
+                df_hexagons.loc[finer, columns] = parent_scores.to_numpy()
+            missing = df_hexagons[TRANSIT_COLUMN_PREFIX].isna().to_numpy()
+
+    if missing.sum() > max_on_demand:
+        print(f"Warning: {int(missing.sum())} hexagons without precomputed transit scores exceed the "
+              f"on-demand limit of {max_on_demand}, transit columns dropped")
+        return df_hexagons.drop(columns=columns)
+    if missing.any():
+        df_hexagons.loc[missing, columns] = get_transit_accessibility_scores(
+            timetable, df_pois, list(df_hexagons.loc[missing, 'hex_id'])
+        ).to_numpy()
+    return df_hexagons
+
+
+def add_transit_to_store(timetable, df_pois, store_dir=DEFAULT_STORE_DIR):
+    """
+    Precompute the transit columns (overall and per departure window) for every
+    stored cell and save them next to the other no_car columns.
+    Re-run after POI or feed updates.
+    """
+    with open(os.path.join(store_dir, "meta.json")) as f:
+        meta = json.load(f)
+    hex_ids = np.load(os.path.join(store_dir, "hex_ids.npy"))
+    hexagons = [h3.int_to_str(int(hex_id)) for hex_id in hex_ids]
+
+    df_scores = get_transit_accessibility_scores(timetable, df_pois, hexagons)
+    for col in df_scores.columns:
+        np.save(os.path.join(store_dir, "no_car", f"{col}.npy"), df_scores[col].to_numpy())
+        if col not in meta['columns']['no_car']:
+            meta['columns']['no_car'].append(col)
+    with open(os.path.join(store_dir, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=4)
+    print(f"Saved transit accessibility for {len(hexagons)} hexagons: {store_dir}")
+    return meta
+
+
+if __name__ == '__main__':
+    # Offline build step (after src.accessibility_store): python -m src.transit
+    from src.fetch_csv_data import load_pois
+    add_transit_to_store(load_transit_timetable(), load_pois())
@@ -4,6 +4,7 @@ from folium.plugins import HeatMap
 from shapely.geometry import Polygon
 import h3
 import numpy as np
+from src.h3_geometry import cell_boundary
 
 
 def get_tier_colors(n_tiers):
@@ -37,8 +38,8 @@ def get_tier_colors(n_tiers):
 def hex_to_polygon(hex_id):
     """Convert H3 hexagon ID to Shapely polygon."""
     try:
-        boundary = h3.cell_to_boundary(hex_id)
-        return Polygon([(lon, lat) for lat, lon in boundary])
+        boundary = cell_boundary(hex_id)
+        return Polygon(boundary[:, ::-1])
     except Exception as e:
         raise ValueError(f"Failed to convert hex_id {hex_id} to polygon: {str(e)}")
 
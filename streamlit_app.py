@@ -3,7 +3,7 @@ import pydeck as pdk
 import pandas as pd
 import json
 import requests
-import h3
+from src.h3_geometry import polygon_coords
 
 
 # pdk.settings.mapbox_api_key = "test_token"
@@ -190,25 +190,8 @@ with col_center:
         # Convert to DataFrame
         df = pd.DataFrame(st.session_state.data)
         
-        # Add hex boundary coordinates for visualization
-        # Add hex boundary coordinates for visualization
-        def hex_to_polygon_coords(hex_id):
-            """Universal H3 → pydeck polygon converter (works with h3-py 3.x and 4.x)"""
-            try:
-                # New h3-py v4+ (returns lon, lat)
-                boundary = h3.cell_to_boundary(hex_id, geo_json=True)
-                coords = [list(point) for point in boundary]
-            except TypeError:
-                # Old h3-py v3.x (returns lat, lon)
-                boundary = h3.cell_to_boundary(hex_id)
-                coords = [[lon, lat] for lat, lon in boundary]
-            
-            if coords:
-                coords.append(coords[0])  # Close ring
-            return coords
-
-        # Apply it
-        df['polygon'] = df['hex_id'].apply(hex_to_polygon_coords)
+        # Add hex boundary coordinates for visualization (closed [lon, lat] rings from the geometry cache)
+        df['polygon'] = polygon_coords(df['hex_id'])
         
         # Normalize scores to 0-1 range for consistent coloring
         if 'user_match_score' in df.columns: